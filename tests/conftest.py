@@ -33,7 +33,20 @@ assert any(app in INSTALLED_APPS for app in ['posts.apps.PostsConfig', 'posts'])
     'Пожалуйста зарегистрируйте приложение в `settings.INSTALLED_APPS`'
 )
 
+import pytest
+
+
+@pytest.hookimpl(hookwrapper=True)
+def pytest_runtest_call(item):
+    # Миниатюры рисуются в фоне после коммита; ждем их до того,
+    # как фикстура mock_media удалит временный MEDIA_ROOT
+    yield
+    from posts.thumbnails import wait_for_thumbnails
+    wait_for_thumbnails()
+
+
 pytest_plugins = [
     'tests.fixtures.fixture_user',
     'tests.fixtures.fixture_data',
+    'tests.fixtures.fixture_queries',
 ]
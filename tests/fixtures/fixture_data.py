@@ -1,3 +1,4 @@
+import shutil
 import tempfile
 
 import pytest
@@ -5,6 +6,15 @@ from mixer.backend.django import mixer as _mixer
 from posts.models import Post, Group
 
 
+@pytest.fixture(autouse=True)
+def isolated_media(settings):
+    # Загрузки, миниатюры и копии не должны попадать в настоящий MEDIA_ROOT
+    temp_directory = tempfile.mkdtemp()
+    settings.MEDIA_ROOT = temp_directory
+    yield temp_directory
+    shutil.rmtree(temp_directory, ignore_errors=True)
+
+
 @pytest.fixture()
 def mock_media(settings):
     with tempfile.TemporaryDirectory() as temp_directory:
@@ -0,0 +1,26 @@
+import pytest
+from django.core.cache import cache
+
+# Наибольшее число SQL-запросов на страницу при пустом кеше.
+# Число не должно зависеть от количества постов, комментариев и подписок.
+QUERY_BUDGETS = {
+    'posts:index': 3,
+    'posts:search': 4,
+    'posts:group_list': 5,
+    'posts:profile': 6,
+    'posts:post_detail': 4,
+    'posts:post_comments': 2,
+    'posts:post_create': 3,
+    'posts:post_edit': 5,
+    'posts:follow_index': 4,
+}
+
+
+@pytest.fixture
+def query_budget(django_assert_max_num_queries):
+    """Проверка бюджета запросов страницы: with query_budget('posts:index')."""
+    def check(url_name):
+        cache.clear()
+        return django_assert_max_num_queries(
+            QUERY_BUDGETS[url_name], info=f'Бюджет запросов {url_name}')
+    return check
@@ -0,0 +1,63 @@
+import pytest
+from django.urls import reverse
+
+from posts.models import Comment, Follow, Post
+from tests.fixtures.fixture_queries import QUERY_BUDGETS
+
+
+def populate(mixer, user, group, size):
+    """Посты, комментарии и подписки в количестве, зависящем от size."""
+    authors = mixer.cycle(size).blend('auth.User')
+    for author in authors:
+        Follow.objects.create(user=user, author=author)
+        Follow.objects.create(user=author, author=user)
+    posts = [
+        Post.objects.create(author=author, group=group, text='Пост')
+        for author in authors
+    ] + [
+        Post.objects.create(author=user, group=group, text='Свой пост')
+        for _ in range(size)
+    ]
+    for post in posts:
+        for author in authors:
+            Comment.objects.create(post=post, author=author, text='Пост')
+
+
+def page_url(url_name, user, group):
+    post = user.posts.first()
+    kwargs = {
+        'posts:group_list': {'slug': group.slug},
+        'posts:profile': {'username': user.username},
+        'posts:post_detail': {'post_id': post.pk},
+        'posts:post_comments': {'post_id': post.pk},
+        'posts:post_edit': {'post_id': post.pk},
+    }.get(url_name, {})
+    data = {'q': 'пост'} if url_name == 'posts:search' else {}
+    return reverse(url_name, kwargs=kwargs), data
+
+
+class TestQueryBudget:
+
+    @pytest.mark.django_db
+    @pytest.mark.parametrize('url_name', QUERY_BUDGETS)
+    def test_page_fits_query_budget(
+            self, url_name, user_client, user, group, mixer, query_budget):
+        populate(mixer, user, group, 2)
+        url, data = page_url(url_name, user, group)
+        with query_budget(url_name) as small:
+            assert user_client.get(url, data).status_code == 200
+        populate(mixer, user, group, 8)
+        with query_budget(url_name) as large:
+            assert user_client.get(url, data).status_code == 200
+        assert len(large) == len(small), (
+            f'Число запросов страницы `{url_name}` растет вместе с данными: '
+            f'{len(small)} -> {len(large)}. Похоже на N+1 в шаблоне или view.'
+        )
+
+    @pytest.mark.django_db
+    def test_budget_catches_n_plus_one(self, user, mixer, query_budget):
+        mixer.cycle(QUERY_BUDGETS['posts:index']).blend(Post, author=user)
+        with pytest.raises(pytest.fail.Exception):
+            with query_budget('posts:index'):
+                for post in Post.objects.all():
+                    post.author.username
@@ -0,0 +1,209 @@
+"""Выборочные замеры запросов: SQL, шаблоны и кеш по каждому view.
+
+Замеряется доля запросов METRICS_SAMPLE_RATE, остальные проходят
+без обертки. Суммы по всем процессам сервера /metrics видит только
+с memcached: там incr общий и атомарный. В locmem у каждого воркера
+свои суммы, а в file и db incr - это чтение и запись, одновременные
+шаги в них терялись бы, поэтому с ними суммы копятся в памяти процесса.
+В обоих случаях /metrics показывает только воркер, ответивший на запрос.
+"""
+import threading
+import time
+from collections import Counter
+
+from django.core.cache import cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.cache.backends.memcached import BaseMemcachedCache
+from django.template import TemplateDoesNotExist
+from django.template.backends import django as django_backend
+from django.urls import URLPattern, URLResolver, get_resolver
+
+METRICS = (
+    ('requests', 'Замеренные запросы'),
+    ('seconds', 'Время обработки'),
+    ('sql_queries', 'SQL-запросы'),
+    ('sql_seconds', 'Время SQL'),
+    ('template_seconds', 'Время отрисовки шаблонов'),
+    ('cache_hits', 'Попадания в кеш'),
+    ('cache_misses', 'Промахи кеша'),
+)
+# Секунды хранятся в кеше целыми микросекундами: incr работает с int
+MICROSECONDS = 1000000
+# Бэкенды с атомарным incr, в которых можно копить суммы
+ATOMIC_BACKENDS = (BaseMemcachedCache, LocMemCache)
+
+_totals = Counter()
+_totals_lock = threading.Lock()
+
+_local = threading.local()
+
+
+class Sample:
+    """Замеры одного запроса."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.sql_queries = 0
+        self.sql_seconds = 0.0
+        self.template_seconds = 0.0
+        self.template_depth = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def execute(self, execute, sql, params, many, context):
+        """Обертка для connection.execute_wrapper."""
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql_queries += 1
+            self.sql_seconds += time.perf_counter() - started
+
+    def values(self):
+        return {
+            'requests': 1,
+            'seconds': time.perf_counter() - self.started,
+            'sql_queries': self.sql_queries,
+            'sql_seconds': self.sql_seconds,
+            'template_seconds': self.template_seconds,
+            'cache_hits': self.cache_hits,
+            'cache_misses': self.cache_misses,
+        }
+
+
+def start_sample():
+    _local.sample = Sample()
+    return _local.sample
+
+
+def stop_sample():
+    _local.sample = None
+
+
+def count_cache(hit):
+    """Отмечает попадание или промах кеша в текущем замере, если он идет."""
+    sample = getattr(_local, 'sample', None)
+    if sample is None:
+        return
+    if hit:
+        sample.cache_hits += 1
+    else:
+        sample.cache_misses += 1
+
+
+class TimedTemplate(django_backend.Template):
+    """Шаблон, время отрисовки которого входит в текущий замер."""
+
+    def render(self, context=None, request=None):
+        sample = getattr(_local, 'sample', None)
+        if sample is None:
+            return super().render(context, request)
+        # Вложенный render_to_string уже входит во время внешнего
+        sample.template_depth += 1
+        started = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            sample.template_depth -= 1
+            if not sample.template_depth:
+                sample.template_seconds += time.perf_counter() - started
+
+
+class TimedDjangoTemplates(django_backend.DjangoTemplates):
+    """Движок шаблонов Django с замером отрисовки; подключается в TEMPLATES."""
+
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return TimedTemplate(
+                self.engine.get_template(template_name), self)
+        except TemplateDoesNotExist as exc:
+            django_backend.reraise(exc, self)
+
+
+def metric_key(view, name):
+    return f'metrics:{view}:{name}'
+
+
+def totals_in_cache():
+    return isinstance(caches['default'], ATOMIC_BACKENDS)
+
+
+def add(key, delta):
+    if not totals_in_cache():
+        with _totals_lock:
+            _totals[key] += delta
+        return
+    try:
+        cache.incr(key, delta)
+    except ValueError:
+        if not cache.add(key, delta, None):
+            cache.incr(key, delta)
+
+
+def get_totals(keys):
+    if totals_in_cache():
+        return cache.get_many(keys)
+    with _totals_lock:
+        return {key: _totals[key] for key in keys if key in _totals}
+
+
+def record(view, values):
+    for name, value in values.items():
+        if name.endswith('seconds'):
+            value = int(value * MICROSECONDS)
+        add(metric_key(view, name), value)
+
+
+def view_names(resolver=None, namespace=''):
+    """Имена всех маршрутов проекта в виде namespace:name."""
+    resolver = resolver or get_resolver()
+    for pattern in resolver.url_patterns:
+        if isinstance(pattern, URLResolver):
+            prefix = namespace
+            if pattern.namespace:
+                prefix = f'{namespace}{pattern.namespace}:'
+            yield from view_names(pattern, prefix)
+        elif isinstance(pattern, URLPattern) and pattern.name:
+            yield f'{namespace}{pattern.name}'
+
+
+def collect():
+    """Накопленные суммы по view: {view: {метрика: значение}}."""
+    views = sorted(set(view_names()))
+    keys = [
+        metric_key(view, name) for view in views for name, _ in METRICS
+    ]
+    stored = get_totals(keys)
+    result = {}
+    for view in views:
+        values = {
+            name: stored.get(metric_key(view, name), 0)
+            for name, _ in METRICS
+        }
+        if values['requests']:
+            result[view] = {
+                name: value / MICROSECONDS if name.endswith('seconds')
+                else value
+                for name, value in values.items()
+            }
+    return result
+
+
+def render_prometheus(sample_rate):
+    """Метрики в текстовом формате Prometheus."""
+    lines = [
+        '# HELP yatube_metrics_sample_rate Доля замеряемых запросов',
+        '# TYPE yatube_metrics_sample_rate gauge',
+        f'yatube_metrics_sample_rate {sample_rate}',
+    ]
+    collected = collect()
+    for name, description in METRICS:
+        metric = f'yatube_view_{name}_total'
+        lines.append(f'# HELP {metric} {description}')
+        lines.append(f'# TYPE {metric} counter')
+        for view, values in collected.items():
+            lines.append(f'{metric}{{view="{view}"}} {values[name]}')
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,101 @@
+import tempfile
+
+from django.core.cache import cache
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+from core import metrics
+from posts.models import Post, User
+
+
+class RequestMetricsTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='author')
+        cls.staff = User.objects.create_user(
+            username='staff', is_staff=True)
+        Post.objects.create(author=cls.user, text='Тестовый пост')
+
+    def setUp(self):
+        cache.clear()
+        self.staff_client = Client()
+        self.staff_client.force_login(self.staff)
+
+    @override_settings(METRICS_SAMPLE_RATE=1)
+    def test_sampled_request_has_server_timing(self):
+        """Замеренный запрос персонала получает заголовок Server-Timing."""
+        response = self.staff_client.get(reverse('posts:index'))
+        timing = response['Server-Timing']
+        self.assertIn('sql;dur=', timing)
+        self.assertIn('tpl;dur=', timing)
+        self.assertIn('cache;desc="hit=0 miss=', timing)
+        response = self.staff_client.get(reverse('posts:index'))
+        self.assertIn('cache;desc="hit=', response['Server-Timing'])
+        self.assertNotIn('hit=0', response['Server-Timing'])
+
+    @override_settings(METRICS_SAMPLE_RATE=1)
+    def test_server_timing_is_hidden_from_visitors(self):
+        """Посетителю Server-Timing не отдается, кроме режима отладки."""
+        response = self.client.get(reverse('posts:index'))
+        self.assertFalse(response.has_header('Server-Timing'))
+        with self.settings(DEBUG=True):
+            response = self.client.get(reverse('posts:index'))
+        self.assertTrue(response.has_header('Server-Timing'))
+
+    @override_settings(METRICS_SAMPLE_RATE=0)
+    def test_unsampled_request_is_untouched(self):
+        """Без выборки запрос проходит без замеров."""
+        response = self.client.get(reverse('posts:index'))
+        self.assertFalse(response.has_header('Server-Timing'))
+
+    @override_settings(METRICS_SAMPLE_RATE=1)
+    def test_metrics_endpoint(self):
+        """Суммы по view доступны в формате Prometheus."""
+        self.client.get(reverse('posts:index'))
+        self.client.get(reverse('posts:index'))
+        response = self.staff_client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 200)
+        body = response.content.decode()
+        self.assertIn(
+            'yatube_view_requests_total{view="posts:index"} 2', body)
+        self.assertIn(
+            'yatube_view_sql_queries_total{view="posts:index"}', body)
+        self.assertIn('yatube_metrics_sample_rate 1', body)
+
+    @override_settings(METRICS_SAMPLE_RATE=1)
+    def test_file_cache_totals_stay_in_process(self):
+        """С файловым кешем без атомарного incr суммы копятся в процессе."""
+        with tempfile.TemporaryDirectory() as location:
+            file_cache = {
+                'default': {
+                    'BACKEND': 'django.core.cache.backends.filebased.'
+                               'FileBasedCache',
+                    'LOCATION': location,
+                },
+            }
+            with self.settings(CACHES=file_cache):
+                metrics._totals.clear()
+                self.client.get(reverse('posts:index'))
+                self.client.get(reverse('posts:index'))
+                key = metrics.metric_key('posts:index', 'requests')
+                self.assertIsNone(cache.get(key))
+                response = self.staff_client.get(reverse('metrics'))
+                metrics._totals.clear()
+        self.assertIn(
+            'yatube_view_requests_total{view="posts:index"} 2',
+            response.content.decode())
+
+    def test_metrics_endpoint_is_internal(self):
+        """Без персонала и токена эндпоинт метрик не виден, с любого IP."""
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 404)
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_metrics_endpoint_with_token(self):
+        """Сборщик получает метрики по токену из настроек."""
+        url = reverse('metrics')
+        response = self.client.get(url, HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get(url, HTTP_AUTHORIZATION='Bearer wrong')
+        self.assertEqual(response.status_code, 404)
@@ -1,4 +1,9 @@
+from django.conf import settings
+from django.http import Http404, HttpResponse
 from django.shortcuts import render
+from django.utils.crypto import constant_time_compare
+
+from .metrics import render_prometheus
 
 
 def page_not_found(request, exception):
@@ -15,3 +20,24 @@ def permission_denied(request, exception):
 
 def csrf_failure(request, reason=''):
     return render(request, 'core/403csrf.html')
+
+
+def has_metrics_token(request):
+    """Запрос несет токен METRICS_TOKEN в заголовке Authorization."""
+    if not settings.METRICS_TOKEN:
+        return False
+    return constant_time_compare(
+        request.META.get('HTTP_AUTHORIZATION', ''),
+        f'Bearer {settings.METRICS_TOKEN}')
+
+
+def metrics(request):
+    """Метрики для Prometheus: персоналу или по токену сборщика.
+
+    Адрес клиента за прокси подделывается, поэтому доступ по IP не дается.
+    """
+    if not request.user.is_staff and not has_metrics_token(request):
+        raise Http404
+    return HttpResponse(
+        render_prometheus(settings.METRICS_SAMPLE_RATE),
+        content_type='text/plain; version=0.0.4; charset=utf-8')
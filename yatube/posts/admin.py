@@ -1,6 +1,9 @@
 from django.contrib import admin
 
 from .models import Comment, Follow, Group, Post
+from .search import search_post_ids
+
+ADMIN_SEARCH_LIMIT = 1000
 
 
 @admin.register(Group)
@@ -30,6 +33,13 @@ class PostAdmin(admin.ModelAdmin):
     empty_value_display = '-пусто-'
     list_editable = ('group',)
 
+    def get_search_results(self, request, queryset, search_term):
+        """Поиск по полнотекстовому индексу вместо LIKE '%q%'."""
+        if not search_term:
+            return queryset, False
+        post_ids = search_post_ids(search_term, ADMIN_SEARCH_LIMIT)
+        return queryset.filter(pk__in=post_ids), False
+
 
 @admin.register(Comment)
 class CommentAdmin(admin.ModelAdmin):
@@ -0,0 +1,126 @@
+"""JSON API только для чтения: ленты, профиль и пост.
+
+Каждый ответ несет сильный ETag (см. conditional), поэтому повторный
+запрос с If-None-Match получает 304, не трогая посты и не собирая JSON.
+"""
+from django.http import JsonResponse
+from django.shortcuts import get_object_or_404
+from django.views.decorators.http import require_GET
+
+from .conditional import (conditional, follow_scopes, group_scopes,
+                          index_scopes, post_scopes, profile_scopes)
+from .feeds import attach_posts, feed_entries
+from .models import Group, Post, User
+from .utils import POST_NUMBER, CursorPaginator, get_comment_page
+
+# Компактный JSON: без пробелов и без экранирования кириллицы
+JSON_PARAMS = {'separators': (',', ':'), 'ensure_ascii': False}
+
+
+def api_response(data, status=200):
+    return JsonResponse(data, status=status, json_dumps_params=JSON_PARAMS)
+
+
+def post_data(post):
+    return {
+        'id': post.pk,
+        'text': post.text,
+        'author': post.author.username,
+        'group': post.group.slug if post.group_id else None,
+        'pub_date': post.pub_date,
+        'image': post.image.url if post.image else None,
+    }
+
+
+def comment_data(comment):
+    return {
+        'id': comment.pk,
+        'author': comment.author.username,
+        'text': comment.text,
+        'created': comment.created,
+    }
+
+
+def cursor_page(request, object_list, key_field='pk'):
+    """Страница по курсору `?after=`/`?before=`, как в HTML."""
+    paginator = CursorPaginator(object_list, POST_NUMBER, key_field=key_field)
+    return paginator.get_cursor_page(
+        after=request.GET.get('after'),
+        before=request.GET.get('before'),
+    )
+
+
+def page_data(page):
+    return {
+        'results': [post_data(post) for post in page],
+        'next': page.paginator.next_cursor,
+        'previous': page.paginator.previous_cursor,
+    }
+
+
+@require_GET
+@conditional(index_scopes)
+def index(request):
+    post_list = Post.objects.select_related('author', 'group')
+    return api_response(page_data(cursor_page(request, post_list)))
+
+
+@require_GET
+@conditional(group_scopes)
+def group_posts(request, slug):
+    group = get_object_or_404(Group, slug=slug)
+    data = {
+        'group': {
+            'slug': group.slug,
+            'title': group.title,
+            'description': group.description,
+        },
+    }
+    data.update(page_data(cursor_page(
+        request, group.posts.select_related('author'))))
+    return api_response(data)
+
+
+@require_GET
+@conditional(profile_scopes)
+def profile(request, username):
+    author = get_object_or_404(
+        User.objects.select_related('stats'), username=username)
+    stats = getattr(author, 'stats', None)
+    data = {
+        'author': {
+            'username': author.username,
+            'full_name': author.get_full_name(),
+            'posts_count': stats.posts_count if stats else 0,
+            'followers_count': stats.followers_count if stats else 0,
+            'following_count': stats.following_count if stats else 0,
+        },
+    }
+    data.update(page_data(cursor_page(
+        request, author.posts.select_related('group'))))
+    return api_response(data)
+
+
+@require_GET
+@conditional(post_scopes)
+def post_detail(request, post_id):
+    """Пост с первой порцией комментариев; дальше - ?after= по ним."""
+    post = get_object_or_404(
+        Post.objects.select_related('author', 'group'), pk=post_id)
+    comments = get_comment_page(
+        post.comments.select_related('author'),
+        after=request.GET.get('after'))
+    data = post_data(post)
+    data['comments_count'] = post.comments_count
+    data['comments'] = [comment_data(comment) for comment in comments]
+    data['next'] = comments.paginator.next_cursor
+    return api_response(data)
+
+
+@require_GET
+@conditional(follow_scopes, private=True)
+def follow_index(request):
+    if not request.user.is_authenticated:
+        return api_response({'detail': 'Нужно войти в систему.'}, 401)
+    page = cursor_page(request, feed_entries(request.user), 'post_id')
+    return api_response(page_data(attach_posts(page)))
@@ -0,0 +1,81 @@
+from functools import reduce
+from operator import or_
+
+from django.db.models import Count, F, IntegerField, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+
+from .models import Comment, Follow, Post, User, UserStats
+
+BATCH_SIZE = 1000
+# Счетчик пользователя: какая модель и по какому полю на него ссылается
+USER_COUNTERS = {
+    'posts_count': (Post, 'author'),
+    'followers_count': (Follow, 'author'),
+    'following_count': (Follow, 'user'),
+}
+POST_COUNTERS = {
+    'comments_count': (Comment, 'post'),
+}
+
+
+def change_user_counters(user_id, **deltas):
+    """Атомарно сдвигает счетчики пользователя без чтения строки."""
+    UserStats.objects.filter(user_id=user_id).update(**{
+        name: F(name) + delta for name, delta in deltas.items()
+    })
+
+
+def change_comments_count(post_id, delta):
+    Post.objects.filter(pk=post_id).update(
+        comments_count=F('comments_count') + delta)
+
+
+def count_of(model, field, outer):
+    counts = model.objects.filter(**{field: OuterRef(outer)}).order_by(
+    ).values(field).annotate(total=Count('pk')).values('total')
+    return Coalesce(Subquery(counts, output_field=IntegerField()), 0)
+
+
+def reconcile(queryset, counters, outer):
+    """Пересчитывает разошедшиеся счетчики, возвращает число строк."""
+    real = {
+        name: count_of(model, field, outer)
+        for name, (model, field) in counters.items()
+    }
+    drifted = queryset.annotate(**{
+        f'real_{name}': value for name, value in real.items()
+    }).filter(reduce(or_, (
+        ~Q(**{name: F(f'real_{name}')}) for name in counters
+    ))).values_list('pk', flat=True)
+    pks = list(drifted)
+    for start in range(0, len(pks), BATCH_SIZE):
+        queryset.model.objects.filter(
+            pk__in=pks[start:start + BATCH_SIZE]).update(**real)
+    return len(pks)
+
+
+def reconcile_user_counters(user_ids=None):
+    users = User.objects.all()
+    if user_ids is not None:
+        users = users.filter(pk__in=user_ids)
+    # Размер пачки bulk_create выбирает сам: в SQLite в одном INSERT
+    # не больше 500 строк, а BATCH_SIZE рассчитан на UPDATE по pk
+    UserStats.objects.bulk_create(
+        [
+            UserStats(user_id=pk)
+            for pk in users.filter(stats__isnull=True).values_list(
+                'pk', flat=True)
+        ],
+        ignore_conflicts=True,
+    )
+    stats = UserStats.objects.all()
+    if user_ids is not None:
+        stats = stats.filter(user_id__in=user_ids)
+    return reconcile(stats, USER_COUNTERS, 'user_id')
+
+
+def reconcile_comment_counters(post_ids=None):
+    posts = Post.objects.order_by()
+    if post_ids is not None:
+        posts = posts.filter(pk__in=post_ids)
+    return reconcile(posts, POST_COUNTERS, 'pk')
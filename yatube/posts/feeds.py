@@ -0,0 +1,78 @@
+from django.db import connection
+
+from .models import FeedEntry, Post
+
+FEED_LENGTH = 1000
+# Столько лент обрезается одним запросом
+TRIM_BATCH = 500
+
+
+def trim_feeds(user_ids):
+    """Оставляет во "входящих" только FEED_LENGTH последних постов.
+
+    Лишние записи целой пачки лент удаляются одним запросом. Порядок тот
+    же, что у страниц ленты, - (pub_date, post_id), поэтому посты с
+    одинаковой датой не уносят ленту ниже FEED_LENGTH.
+    """
+    user_ids = list(user_ids)
+    table = connection.ops.quote_name(FeedEntry._meta.db_table)
+    for start in range(0, len(user_ids), TRIM_BATCH):
+        batch = user_ids[start:start + TRIM_BATCH]
+        placeholders = ', '.join(['%s'] * len(batch))
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {table} WHERE id IN ('
+                f'SELECT id FROM (SELECT id, ROW_NUMBER() OVER ('
+                f'PARTITION BY user_id ORDER BY pub_date DESC, post_id DESC'
+                f') AS position FROM {table} '
+                f'WHERE user_id IN ({placeholders})) AS ranked '
+                f'WHERE position > %s)',
+                [*batch, FEED_LENGTH])
+
+
+def push_post(post, follower_ids):
+    """Раскладывает новый пост по лентам подписчиков автора."""
+    FeedEntry.objects.bulk_create(
+        [
+            FeedEntry(user_id=user_id, post=post, pub_date=post.pub_date)
+            for user_id in follower_ids
+        ],
+        ignore_conflicts=True,
+    )
+    trim_feeds(follower_ids)
+
+
+def backfill_feed(user_id, author_id):
+    """Добавляет в ленту подписчика последние посты нового автора."""
+    posts = Post.objects.filter(author_id=author_id).order_by(
+        '-pub_date', '-pk').values_list('pk', 'pub_date')[:FEED_LENGTH]
+    FeedEntry.objects.bulk_create(
+        [
+            FeedEntry(user_id=user_id, post_id=pk, pub_date=pub_date)
+            for pk, pub_date in posts
+        ],
+        ignore_conflicts=True,
+    )
+    trim_feeds([user_id])
+
+
+def prune_feed(user_id, author_id):
+    """Убирает из ленты посты автора, от которого отписались."""
+    FeedEntry.objects.filter(
+        user_id=user_id, post__author_id=author_id).delete()
+
+
+def feed_entries(user):
+    """Записи ленты подписчика в порядке индекса (user, pub_date, post)."""
+    return FeedEntry.objects.filter(user=user).order_by(
+        '-pub_date', '-post_id')
+
+
+def attach_posts(page):
+    """Подменяет записи ленты на страницу их постов одним in_bulk."""
+    posts = Post.objects.select_related('author', 'group').in_bulk(
+        [entry.post_id for entry in page])
+    page.object_list = [
+        posts[entry.post_id] for entry in page if entry.post_id in posts
+    ]
+    return page
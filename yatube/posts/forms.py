@@ -1,7 +1,10 @@
 from django import forms
 from django.forms import ModelForm
 
-from .models import Comment, Post
+from .models import Comment, Post, PostRendition
+from .storage import media_storage
+from .thumbnails import schedule_thumbnail
+from .uploads import process_upload
 
 
 class PostForm(forms.ModelForm):
@@ -16,6 +19,68 @@ class PostForm(forms.ModelForm):
     def clean_group(self):
         return self.cleaned_data['group']
 
+    def clean_image(self):
+        """Проверяет лимиты и пересохраняет картинку без метаданных."""
+        image = self.cleaned_data['image']
+        if 'image' not in self.changed_data:
+            return image
+        if not image:
+            self.instance.image_hash = ''
+            return image
+        image, self.instance.image_hash = process_upload(image)
+        return image
+
+    def reuse_same_image(self):
+        """Подставляет уже загруженную картинку с тем же содержимым.
+
+        Файлы картинки и ее копий обновляют время изменения, чтобы
+        release_files не удалил их до фиксации этого поста.
+        """
+        same = Post.objects.filter(
+            image_hash=self.instance.image_hash
+        ).exclude(pk=self.instance.pk).exclude(thumbnail='').first()
+        if same is None or not media_storage.touch(same.image.name):
+            return None
+        media_storage.touch(same.thumbnail.name)
+        for rendition in same.renditions.all():
+            media_storage.touch(rendition.image.name)
+        self.instance.image = same.image.name
+        self.instance.thumbnail = same.thumbnail.name
+        return same
+
+    def save(self, commit=True):
+        """Новая картинка получает миниатюру в фоне после сохранения.
+
+        Если такая же картинка уже есть у другого поста, файл и его копии
+        используются повторно без пересохранения и обработки.
+        """
+        image_changed = 'image' in self.changed_data
+        same = None
+        if image_changed:
+            self.instance.thumbnail = ''
+            if self.instance.image_hash:
+                same = self.reuse_same_image()
+        post = super().save(commit)
+        if not commit or not image_changed:
+            return post
+        if not post.image:
+            # Копии убранной картинки больше не нужны; их файлы отпустит
+            # сигнал удаления PostRendition
+            post.renditions.all().delete()
+            return post
+        if same is None:
+            schedule_thumbnail(post)
+            return post
+        post.renditions.all().delete()
+        PostRendition.objects.bulk_create(
+            PostRendition(
+                post=post,
+                width=rendition.width,
+                format=rendition.format,
+                image=rendition.image.name)
+            for rendition in same.renditions.all())
+        return post
+
 
 class CommentForm(ModelForm):
     class Meta:
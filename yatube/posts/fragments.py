@@ -0,0 +1,134 @@
+import os
+import time
+
+from django.core.cache import cache, caches
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.cache.backends.locmem import LocMemCache
+
+from core.metrics import count_cache
+
+FRAGMENT_TIMEOUT = 60 * 60 * 12
+STALE_TIMEOUT = 60 * 10
+LOCK_TIMEOUT = 30
+# Локальный кеш у каждого процесса свой: сброс версии в одном воркере
+# не виден другим. Там версии и фрагменты живут столько же, сколько
+# жил {% cache 20 %} до версий.
+LOCAL_TIMEOUT = 20
+
+
+def is_local_cache():
+    return isinstance(caches['default'], LocMemCache)
+
+
+def version_timeout():
+    """Версии в общем кеше бессрочны, в локальном - LOCAL_TIMEOUT."""
+    return LOCAL_TIMEOUT if is_local_cache() else None
+
+
+def lock_path(backend, key):
+    # Рядом с файлом записи, но с другим суффиксом: clear и отсев
+    # файлового кеша блокировки не трогают
+    return f'{backend._key_to_file(key)}.lock'
+
+
+def acquire_lock(key):
+    """Берет блокировку пересборки; False, если ее держит другой процесс.
+
+    add файлового кеша - это проверка и запись без атомарности, поэтому
+    там блокировка - файл, созданный с O_EXCL. Файл старше LOCK_TIMEOUT
+    считается брошенным упавшим процессом и перехватывается.
+    """
+    backend = caches['default']
+    if not isinstance(backend, FileBasedCache):
+        return cache.add(key, 1, LOCK_TIMEOUT)
+    path = lock_path(backend, key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    try:
+        if time.time() - os.path.getmtime(path) > LOCK_TIMEOUT:
+            os.remove(path)
+    except FileNotFoundError:
+        pass
+    try:
+        os.close(os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+    except FileExistsError:
+        return False
+    return True
+
+
+def release_lock(key):
+    backend = caches['default']
+    if not isinstance(backend, FileBasedCache):
+        cache.delete(key)
+        return
+    try:
+        os.remove(lock_path(backend, key))
+    except FileNotFoundError:
+        pass
+
+
+def version_key(scope):
+    return f'posts:version:{scope}'
+
+
+def scope_versions(*scopes):
+    """Версии разделов в наносекундах: момент последнего изменения.
+
+    Для раздела без версии в кеше заводится текущий момент, он не раньше
+    настоящего изменения.
+    """
+    keys = [version_key(scope) for scope in scopes]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, time.time_ns(), version_timeout())
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+def fragment_version(*scopes):
+    """Версия закешированных фрагментов для набора разделов.
+
+    Версия раздела меняется при каждом изменении его содержимого, поэтому
+    ключи фрагментов устаревают сразу, а не по истечении TTL.
+    """
+    return '-'.join(str(version) for version in scope_versions(*scopes))
+
+
+def bump_versions(scopes):
+    """Делает недействительными фрагменты перечисленных разделов."""
+    version = time.time_ns()
+    cache.set_many(
+        {version_key(scope): version for scope in scopes},
+        version_timeout())
+
+
+def get_or_build(key, version, build, timeout=None):
+    """Значение из кеша с защитой от одновременной пересборки.
+
+    Запись хранит версию и момент обновления. Когда она устарела, строит
+    новое значение только процесс, взявший блокировку, остальные отдают
+    прежнюю копию. Без копии в кеше значение строится на месте.
+    """
+    if timeout is None:
+        timeout = LOCAL_TIMEOUT if is_local_cache() else FRAGMENT_TIMEOUT
+    entry = cache.get(key)
+    now = time.time()
+    if entry is not None:
+        entry_version, refresh_at, value = entry
+        if entry_version == version and now < refresh_at:
+            count_cache(hit=True)
+            return value
+    lock_key = f'{key}:lock'
+    if not acquire_lock(lock_key):
+        count_cache(hit=entry is not None)
+        if entry is not None:
+            return value
+        return build()
+    count_cache(hit=False)
+    try:
+        value = build()
+        cache.set(
+            key, (version, now + timeout, value), timeout + STALE_TIMEOUT)
+    finally:
+        release_lock(lock_key)
+    return value
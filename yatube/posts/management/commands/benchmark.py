@@ -0,0 +1,228 @@
+import json
+import math
+import time
+import tracemalloc
+from functools import partial
+from pathlib import Path
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, reset_queries
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from posts import urls as posts_urls
+from posts.models import Group, User
+from posts.search import fts_available, rebuild_index
+from posts.seed import PREFIX, seed, seed_prolific
+from posts.utils import POST_NUMBER
+
+REQUESTS = 50
+# Столько постов у отдельного автора, чей профиль замеряется отдельно
+AUTHOR_POSTS = 100000
+TOLERANCE = 0.25
+PERCENTILES = (50, 95, 99)
+# Метод и данные для маршрутов, которые не открываются простым GET
+ROUTE_REQUESTS = {
+    'search': ('get', {'q': 'пост'}),
+    'add_comment': ('post', {'text': 'Комментарий'}),
+}
+
+
+def percentile(values, percent):
+    """Перцентиль методом ближайшего ранга."""
+    ordered = sorted(values)
+    rank = max(math.ceil(percent / 100 * len(ordered)), 1)
+    return ordered[rank - 1]
+
+
+def regressions(results, baseline, tolerance):
+    """Описания метрик, которые вышли за эталон с учетом допуска."""
+    found = []
+    for name, base in baseline.items():
+        current = results.get(name)
+        if current is None:
+            continue
+        if current['queries'] > base['queries']:
+            found.append(
+                f'{name}: запросов {current["queries"]} > {base["queries"]}')
+        for metric in ('p95', 'alloc_kb'):
+            if current[metric] > base[metric] * (1 + tolerance):
+                found.append(
+                    f'{name}: {metric} {current[metric]:.1f} > '
+                    f'{base[metric]:.1f} + {tolerance:.0%}')
+    return found
+
+
+class Command(BaseCommand):
+    help = ('Заполняет базу тестовыми данными и прогоняет все маршруты '
+            'posts через тестовый клиент: перцентили задержки, число '
+            'SQL-запросов и пик выделенной памяти на запрос. С --baseline '
+            'сравнивает результат с эталоном и падает при регрессии. '
+            'Данные пишутся во временную базу (--test-database) или, '
+            'по явному --in-place, в настроенную.')
+
+    def add_arguments(self, parser):
+        database = parser.add_mutually_exclusive_group()
+        database.add_argument(
+            '--test-database', action='store_true',
+            help='Создать временную базу и удалить ее после замеров.')
+        database.add_argument(
+            '--in-place', action='store_true',
+            help='Заполнить настроенную базу: только для отдельной базы '
+                 'бенчмарка.')
+        parser.add_argument(
+            '--keepdb', action='store_true',
+            help='Не удалять временную базу, чтобы не заполнять ее заново.')
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--groups', type=int, default=10)
+        parser.add_argument('--posts', type=int, default=10000)
+        parser.add_argument('--comments', type=int, default=10000)
+        parser.add_argument('--follows', type=int, default=1000)
+        parser.add_argument(
+            '--author-posts', type=int, default=AUTHOR_POSTS,
+            help='Постов у автора для замера профиля, 0 - не замерять.')
+        parser.add_argument('--requests', type=int, default=REQUESTS)
+        parser.add_argument(
+            '--cold', action='store_true',
+            help='Очищать кеш перед каждым запросом.')
+        parser.add_argument(
+            '--baseline', help='JSON-файл с эталонными результатами.')
+        parser.add_argument(
+            '--save-baseline', action='store_true',
+            help='Записать результат в файл эталона вместо сравнения.')
+        parser.add_argument('--tolerance', type=float, default=TOLERANCE)
+
+    def handle(self, *args, **options):
+        if options['in_place']:
+            self.run(options)
+            return
+        if not options['test_database']:
+            raise CommandError(
+                'Бенчмарк заполняет базу тестовыми данными. Укажите '
+                '--test-database для временной базы или --in-place для '
+                'отдельной базы бенчмарка.')
+        old_name = connection.creation.create_test_db(
+            verbosity=0, autoclobber=True, serialize=False,
+            keepdb=options['keepdb'])
+        try:
+            self.run(options)
+        finally:
+            connection.creation.destroy_test_db(
+                old_name, verbosity=0, keepdb=options['keepdb'])
+
+    def run(self, options):
+        seed(options['posts'], options['users'], options['groups'],
+             options['comments'], options['follows'],
+             report=self.stdout.write)
+        prolific = None
+        if options['author_posts']:
+            prolific = seed_prolific(
+                options['author_posts'], report=self.stdout.write)
+        if fts_available():
+            rebuild_index()
+        cache.clear()
+
+        client = Client()
+        results = {}
+        for name, url, data in self.routes(client, prolific):
+            method, default = ROUTE_REQUESTS.get(name, ('get', {}))
+            data = data or default
+            send = partial(getattr(client, method), url, data)
+            results[name] = self.measure(
+                send, options['requests'], options['cold'])
+        self.print_results(results)
+
+        baseline = options['baseline']
+        if baseline is None:
+            return
+        if options['save_baseline']:
+            Path(baseline).write_text(json.dumps(results, indent=2))
+            self.stdout.write(f'Эталон записан в {baseline}')
+            return
+        found = regressions(
+            results, json.loads(Path(baseline).read_text()),
+            options['tolerance'])
+        if found:
+            raise CommandError('Регрессия:\n' + '\n'.join(found))
+        self.stdout.write(self.style.SUCCESS('Регрессий нет'))
+
+    def routes(self, client, prolific=None):
+        """Все маршруты posts с подставленными тестовыми аргументами.
+
+        Запросы идут от имени автора, у которого есть посты и подписки,
+        поэтому страницы правки и ленты подписок не пустые. Профиль
+        автора `prolific` замеряется на первой и на средней странице:
+        затраты обеих не должны зависеть от числа его постов.
+        """
+        authors = User.objects.filter(
+            username__startswith=PREFIX, posts__isnull=False).distinct()
+        user, other = authors.order_by('pk')[:2]
+        client.force_login(user)
+        values = {
+            'slug': Group.objects.filter(
+                slug__startswith=PREFIX).first().slug,
+            'username': other.username,
+            'post_id': user.posts.first().pk,
+        }
+        for pattern in posts_urls.urlpatterns:
+            kwargs = {
+                name: values[name] for name in pattern.pattern.converters
+            }
+            url = reverse(f'posts:{pattern.name}', kwargs=kwargs)
+            yield pattern.name, url, None
+        if prolific is None:
+            return
+        url = reverse('posts:profile', args=[prolific.username])
+        yield 'profile_prolific', url, None
+        middle = prolific.stats.posts_count // POST_NUMBER // 2 + 1
+        yield 'profile_prolific_middle', url, {'page': middle}
+
+    def measure(self, send, requests, cold):
+        """Один прогревочный, один замерочный и `requests` замеров времени.
+
+        Запросы и память считаются отдельно: tracemalloc и перехват SQL
+        заметно замедляют обработку и исказили бы задержки.
+        """
+        send()
+        if cold:
+            cache.clear()
+        # При DEBUG журнал запросов ограничен и после заполнения базы полон
+        reset_queries()
+        tracemalloc.start()
+        with CaptureQueriesContext(connection) as queries:
+            response = send()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        # Журнал читается лениво, а следующие запросы его сбрасывают
+        query_count = len(queries)
+        if response.status_code >= 400:
+            raise CommandError(
+                f'{response.request["PATH_INFO"]}: '
+                f'ответ {response.status_code}')
+
+        latencies = []
+        for _ in range(requests):
+            if cold:
+                cache.clear()
+            started = time.perf_counter()
+            send()
+            latencies.append((time.perf_counter() - started) * 1000)
+        result = {
+            f'p{percent}': percentile(latencies, percent)
+            for percent in PERCENTILES
+        }
+        result['queries'] = query_count
+        result['alloc_kb'] = peak / 1024
+        return result
+
+    def print_results(self, results):
+        self.stdout.write(
+            f'{"маршрут":<24}{"p50, мс":>10}{"p95, мс":>10}{"p99, мс":>10}'
+            f'{"SQL":>6}{"КБ":>10}')
+        for name, result in results.items():
+            self.stdout.write(
+                f'{name:<24}{result["p50"]:>10.1f}{result["p95"]:>10.1f}'
+                f'{result["p99"]:>10.1f}{result["queries"]:>6}'
+                f'{result["alloc_kb"]:>10.0f}')
@@ -0,0 +1,68 @@
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from posts.models import Comment, Follow, Group, Post, User
+from posts.seed import seed
+
+
+class Command(BaseCommand):
+    help = ('Заполняет базу тестовыми постами и показывает планы запросов '
+            'лент до и после добавления индексов. Все изменения базы '
+            'откатываются по завершении.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--posts', type=int, default=1000000)
+        parser.add_argument('--authors', type=int, default=1000)
+        parser.add_argument('--groups', type=int, default=100)
+
+    def handle(self, *args, **options):
+        # SQLite меняет схему только с выключенными внешними ключами,
+        # а внутри транзакции их уже не выключить
+        connection.disable_constraint_checking()
+        try:
+            with transaction.atomic():
+                self.seed_and_explain(options)
+                transaction.set_rollback(True)
+        finally:
+            connection.enable_constraint_checking()
+
+    def seed_and_explain(self, options):
+        seed(options['posts'], options['authors'], options['groups'],
+             report=self.stdout.write)
+        author = User.objects.filter(posts__isnull=False).first()
+        group = Group.objects.first()
+        post = Post.objects.first()
+        queries = {
+            'index': Post.objects.all()[:10],
+            'profile': Post.objects.filter(author=author)[:10],
+            'group_list': Post.objects.filter(group=group)[:10],
+            'comments': Comment.objects.filter(post=post)[:10],
+            'follow': Follow.objects.filter(user=author, author=author),
+        }
+        self.alter_indexes(drop=True)
+        try:
+            self.explain('Без индексов', queries)
+        finally:
+            self.alter_indexes(drop=False)
+        self.explain('С индексами', queries)
+
+    def alter_indexes(self, drop):
+        """Временно удаляет индексы лент или возвращает их на место."""
+        with connection.schema_editor() as editor:
+            for model in (Post, Comment):
+                for index in model._meta.indexes:
+                    if drop:
+                        editor.remove_index(model, index)
+                    else:
+                        editor.add_index(model, index)
+            for constraint in Follow._meta.constraints:
+                if drop:
+                    editor.remove_constraint(Follow, constraint)
+                else:
+                    editor.add_constraint(Follow, constraint)
+
+    def explain(self, title, queries):
+        self.stdout.write(self.style.MIGRATE_HEADING(title))
+        for name, queryset in queries.items():
+            self.stdout.write(f'{name}:')
+            self.stdout.write(queryset.explain())
@@ -0,0 +1,134 @@
+import csv
+import gzip
+import json
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+from posts.models import Comment, Follow, Group, Post
+
+CHUNK_SIZE = 2000
+# Модель и поле даты, по которому идет водяной знак вместе с id
+EXPORTS = (
+    (Group, None),
+    (Post, 'pub_date'),
+    (Comment, 'created'),
+    (Follow, None),
+)
+
+
+def export_fields(model):
+    return [
+        field for field in model._meta.concrete_fields
+        if not field.primary_key
+    ]
+
+
+def after_watermark(model, date_field, mark):
+    """Строки модели после водяного знака в порядке его роста."""
+    queryset = model._base_manager.all()
+    ordering = ('pk',) if date_field is None else (date_field, 'pk')
+    if mark is not None:
+        if date_field is None:
+            queryset = queryset.filter(pk__gt=mark['pk'])
+        else:
+            date = parse_datetime(mark['date'])
+            queryset = queryset.filter(
+                Q(**{f'{date_field}__gt': date})
+                | Q(**{date_field: date, 'pk__gt': mark['pk']}))
+    return queryset.order_by(*ordering)
+
+
+def to_text(value):
+    if value is None:
+        return ''
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return value
+
+
+class Command(BaseCommand):
+    help = ('Потоково выгружает группы, посты, комментарии и подписки '
+            'в NDJSON или CSV, по файлу на модель. С --watermark '
+            'выгружаются только строки, добавленные после прошлого запуска.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('directory')
+        parser.add_argument(
+            '--format', choices=('ndjson', 'csv'), default='ndjson',
+            dest='output_format')
+        parser.add_argument('--gzip', action='store_true', dest='compress')
+        parser.add_argument(
+            '--watermark',
+            help='JSON-файл с последними выгруженными ключами моделей.')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+
+    def handle(self, directory, output_format, compress, watermark,
+               chunk_size, **options):
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        marks = {}
+        if watermark and Path(watermark).exists():
+            marks = json.loads(Path(watermark).read_text())
+        for model, date_field in EXPORTS:
+            label = model._meta.label_lower
+            name = f'{model._meta.model_name}.{output_format}'
+            path = directory / (f'{name}.gz' if compress else name)
+            queryset = after_watermark(model, date_field, marks.get(label))
+            started = time.monotonic()
+            with self.open(path, compress) as stream:
+                write = getattr(self, f'write_{output_format}')
+                count, last = write(stream, model, queryset, chunk_size)
+            if last is not None:
+                marks[label] = {'pk': last['pk']}
+                if date_field is not None:
+                    marks[label]['date'] = last[date_field].isoformat()
+            elapsed = time.monotonic() - started
+            self.stdout.write(
+                f'{label}: {count} строк за {elapsed:.1f} с -> {path}')
+        if watermark:
+            temporary = Path(f'{watermark}.tmp')
+            temporary.write_text(json.dumps(marks, indent=2))
+            temporary.replace(watermark)
+
+    def open(self, path, compress):
+        if compress:
+            return gzip.open(path, 'wt', encoding='utf-8', newline='')
+        return open(path, 'w', encoding='utf-8', newline='')
+
+    def rows(self, model, queryset, chunk_size):
+        names = ['pk'] + [field.attname for field in export_fields(model)]
+        return queryset.values(*names).iterator(chunk_size=chunk_size)
+
+    def write_ndjson(self, stream, model, queryset, chunk_size):
+        """Строки в формате dumpdata, по объекту JSON на строку."""
+        label = model._meta.label_lower
+        fields = export_fields(model)
+        count, row = 0, None
+        for row in self.rows(model, queryset, chunk_size):
+            obj = {
+                'model': label,
+                'pk': row['pk'],
+                'fields': {
+                    field.name: row[field.attname] for field in fields
+                },
+            }
+            stream.write(json.dumps(
+                obj, cls=DjangoJSONEncoder, ensure_ascii=False))
+            stream.write('\n')
+            count += 1
+        return count, row
+
+    def write_csv(self, stream, model, queryset, chunk_size):
+        names = ['pk'] + [field.attname for field in export_fields(model)]
+        writer = csv.writer(stream)
+        writer.writerow(names)
+        count, row = 0, None
+        for row in self.rows(model, queryset, chunk_size):
+            writer.writerow([to_text(row[name]) for name in names])
+            count += 1
+        return count, row
@@ -0,0 +1,246 @@
+import json
+import re
+import time
+from pathlib import Path
+
+from django.apps import apps
+from django.core.management.base import BaseCommand
+from django.core.management.color import no_style
+from django.core.serializers.base import DeserializationError
+from django.core.serializers.python import Deserializer
+from django.db import connection, transaction
+
+from posts.counters import reconcile_comment_counters, reconcile_user_counters
+from posts.feeds import backfill_feed
+from posts.fragments import bump_versions
+from posts.models import Comment, FeedEntry, Follow, Post
+from posts.search import fts_available, rebuild_index
+from posts.utils import reset_counts
+
+BATCH_SIZE = 5000
+CHUNK_SIZE = 64 * 1024
+WHITESPACE = re.compile(r'\s*')
+
+
+def read_more(stream, tail, chunk_size):
+    """Дочитывает кусок файла к непрочитанному хвосту буфера."""
+    chunk = stream.read(chunk_size)
+    if not chunk:
+        raise DeserializationError('Файл оборвался посреди массива.')
+    return tail + chunk
+
+
+def iter_json_array(stream, chunk_size=CHUNK_SIZE):
+    """Отдает элементы JSON-массива по одному, не читая файл целиком.
+
+    В памяти держится только текущий кусок файла и недочитанный элемент.
+    """
+    decoder = json.JSONDecoder()
+    buffer, position, expect = '', 0, '['
+    while True:
+        position = WHITESPACE.match(buffer, position).end()
+        if position == len(buffer):
+            buffer, position = read_more(stream, '', chunk_size), 0
+            continue
+        char = buffer[position]
+        if char == ']' and expect in ('item', ','):
+            return
+        if expect in ('[', ','):
+            if char != expect:
+                raise DeserializationError(
+                    f'Ожидался символ {expect!r}, а не {char!r}.')
+            position += 1
+            expect = 'item' if expect == '[' else 'value'
+            continue
+        try:
+            item, position = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            buffer = read_more(stream, buffer[position:], chunk_size)
+            position = 0
+            continue
+        expect = ','
+        yield item
+
+
+def dependency_order():
+    """Ранги моделей: каждая идет после тех, на кого ссылается."""
+    order = []
+
+    def visit(model, path):
+        if model in order or model in path:
+            return
+        for field in model._meta.concrete_fields:
+            if field.remote_field is not None:
+                visit(field.remote_field.model, path | {model})
+        order.append(model)
+
+    for model in apps.get_models(include_auto_created=True):
+        visit(model, set())
+    return {model: rank for rank, model in enumerate(order)}
+
+
+class Command(BaseCommand):
+    help = ('Потоково загружает фикстуру dumpdata пачками. Сигналы не '
+            'отправляются; ленты, поисковый индекс, счетчики и кеш '
+            'фрагментов пересчитываются после загрузки. Уже существующие '
+            'записи остаются как есть, поэтому загрузку можно повторить '
+            'или продолжить с --resume.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('fixture')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+        parser.add_argument(
+            '--resume', action='store_true',
+            help='Пропустить объекты, загруженные прошлым запуском.')
+        parser.add_argument(
+            '--keep-indexes', action='store_true',
+            help='Не удалять индексы постов и лент на время загрузки.')
+
+    def handle(self, fixture, batch_size, resume, keep_indexes, **options):
+        self.progress = Path(f'{fixture}.progress')
+        self.batch_size = batch_size
+        self.ranks = dependency_order()
+        self.buffers = {}
+        self.buffered = 0
+        self.models = set()
+        self.authors = set()
+        self.groups = set()
+        self.loaded = 0
+        if resume and self.progress.exists():
+            self.loaded = json.loads(self.progress.read_text())['loaded']
+        self.skipped = self.loaded
+        self.started = time.monotonic()
+
+        if not keep_indexes:
+            self.alter_indexes(drop=True)
+        try:
+            with connection.constraint_checks_disabled():
+                self.load(fixture)
+            tables = [model._meta.db_table for model in self.models]
+            connection.check_constraints(table_names=tables)
+        finally:
+            if not keep_indexes:
+                self.alter_indexes(drop=False)
+        self.reset_sequences()
+        self.rebuild_derived()
+        if self.progress.exists():
+            self.progress.unlink()
+        self.report('Готово')
+
+    def load(self, fixture):
+        with open(fixture, encoding='utf-8') as stream:
+            items = iter_json_array(stream)
+            for _ in range(self.skipped):
+                next(items, None)
+            for deserialized in Deserializer(items, ignorenonexistent=True):
+                self.add(deserialized.object, deserialized.m2m_data)
+                if self.buffered >= self.batch_size:
+                    self.flush()
+        self.flush()
+
+    def add(self, obj, m2m_data):
+        model = type(obj)
+        self.buffers.setdefault(model, []).append(obj)
+        self.buffered += 1
+        for name, values in (m2m_data or {}).items():
+            field = model._meta.get_field(name)
+            through = field.remote_field.through
+            source = f'{field.m2m_field_name()}_id'
+            target = f'{field.m2m_reverse_field_name()}_id'
+            self.buffers.setdefault(through, []).extend(
+                through(**{source: obj.pk, target: value})
+                for value in values)
+
+    def flush(self):
+        """Пишет накопленные объекты одной транзакцией, родителей первыми."""
+        if not self.buffered:
+            return
+        with transaction.atomic():
+            for model in sorted(self.buffers, key=self.ranks.__getitem__):
+                self.insert(model, self.buffers[model])
+        self.track(self.buffers)
+        self.loaded += self.buffered
+        self.buffers, self.buffered = {}, 0
+        self.progress.write_text(json.dumps({'loaded': self.loaded}))
+        self.report('Загружено объектов')
+
+    def insert(self, model, objs):
+        # raw=True, как у loaddata: иначе auto_now_add затрет даты фикстуры
+        self.models.add(model)
+        for with_pk in (True, False):
+            batch = [obj for obj in objs if (obj.pk is not None) == with_pk]
+            if not batch:
+                continue
+            fields = [
+                field for field in model._meta.local_concrete_fields
+                if with_pk or not field.primary_key
+            ]
+            size = max(connection.ops.bulk_batch_size(fields, batch), 1)
+            for start in range(0, len(batch), size):
+                model._base_manager._insert(
+                    batch[start:start + size], fields=fields, raw=True,
+                    ignore_conflicts=True)
+
+    def track(self, buffers):
+        """Запоминает разделы, чьи счетчики и фрагменты устарели."""
+        for post in buffers.get(Post, []):
+            self.authors.add(post.author_id)
+            if post.group_id is not None:
+                self.groups.add(post.group_id)
+        for follow in buffers.get(Follow, []):
+            self.authors.add(follow.author_id)
+        post_ids = {comment.post_id for comment in buffers.get(Comment, [])}
+        bump_versions([f'post:{post_id}' for post_id in post_ids])
+
+    def alter_indexes(self, drop):
+        """Снимает индексы постов и лент или возвращает недостающие."""
+        with connection.cursor() as cursor:
+            existing = {
+                model: connection.introspection.get_constraints(
+                    cursor, model._meta.db_table)
+                for model in (Post, Comment, FeedEntry)
+            }
+        with connection.schema_editor() as editor:
+            for model, constraints in existing.items():
+                for index in model._meta.indexes:
+                    if drop and index.name in constraints:
+                        editor.remove_index(model, index)
+                    elif not drop and index.name not in constraints:
+                        editor.add_index(model, index)
+        if not drop:
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+
+    def reset_sequences(self):
+        statements = connection.ops.sequence_reset_sql(
+            no_style(), list(self.models))
+        with connection.cursor() as cursor:
+            for sql in statements:
+                cursor.execute(sql)
+
+    def rebuild_derived(self):
+        """Досчитывает то, что при обычном сохранении делают сигналы."""
+        followers = set()
+        for user_id, author_id in Follow.objects.values_list(
+                'user_id', 'author_id').iterator():
+            if author_id in self.authors:
+                backfill_feed(user_id, author_id)
+                followers.add(user_id)
+        if {Post, Comment} & self.models and fts_available():
+            rebuild_index()
+        reconcile_user_counters()
+        if {Post, Comment} & self.models:
+            reconcile_comment_counters()
+        scopes = (
+            ['index']
+            + [f'group:{group_id}' for group_id in self.groups]
+            + [f'author:{author_id}' for author_id in self.authors]
+            + [f'follower:{user_id}' for user_id in followers]
+        )
+        reset_counts(scopes)
+        bump_versions(scopes + ['groups'])
+
+    def report(self, title):
+        elapsed = time.monotonic() - self.started
+        rate = (self.loaded - self.skipped) / elapsed if elapsed else 0
+        self.stdout.write(f'{title}: {self.loaded} ({rate:.0f} в секунду)')
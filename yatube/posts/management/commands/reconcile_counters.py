@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from posts.counters import reconcile_comment_counters, reconcile_user_counters
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает счетчики постов, подписчиков, подписок и '
+            'комментариев и исправляет те, что разошлись с данными.')
+
+    def handle(self, *args, **options):
+        users = reconcile_user_counters()
+        posts = reconcile_comment_counters()
+        self.stdout.write(
+            f'Исправлено счетчиков: пользователей {users}, постов {posts}')
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from posts.models import Post
+from posts.thumbnails import render_thumbnail
+
+
+class Command(BaseCommand):
+    help = 'Делает миниатюры для постов с картинкой, у которых их еще нет.'
+
+    def handle(self, *args, **options):
+        post_ids = Post.objects.exclude(image='').filter(
+            thumbnail='').values_list('pk', flat=True)
+        for post_id in post_ids.iterator():
+            render_thumbnail(post_id)
+        self.stdout.write(f'Готово: {len(post_ids)}')
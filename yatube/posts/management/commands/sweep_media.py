@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from posts.media import sweep_media
+
+
+class Command(BaseCommand):
+    help = ('Удаляет файлы медиа, на которые не ссылается ни один пост и '
+            'которые давно не записывались. Подбирает то, что '
+            'release_files пропустил как недавнее; запускать по расписанию.')
+
+    def handle(self, *args, **options):
+        self.stdout.write(f'Удалено файлов: {sweep_media()}')
@@ -0,0 +1,87 @@
+import logging
+from itertools import islice
+
+from django.core.exceptions import SuspiciousFileOperation
+from django.db import transaction
+from django.db.models import Q
+
+from .models import Post, PostRendition
+from .storage import media_storage
+
+logger = logging.getLogger(__name__)
+# Каталог, куда пишут все поля с media_storage
+MEDIA_DIRECTORY = 'posts'
+SWEEP_BATCH = 500
+
+
+def references(name):
+    """Сколько записей ссылается на файл медиа."""
+    return (
+        Post.objects.filter(Q(image=name) | Q(thumbnail=name)).count()
+        + PostRendition.objects.filter(image=name).count()
+    )
+
+
+def referenced(names):
+    """Имена из names, на которые ссылается хотя бы одна запись."""
+    names = list(names)
+    found = set(Post.objects.filter(
+        image__in=names).values_list('image', flat=True))
+    found.update(Post.objects.filter(
+        thumbnail__in=names).values_list('thumbnail', flat=True))
+    found.update(PostRendition.objects.filter(
+        image__in=names).values_list('image', flat=True))
+    return found
+
+
+def delete_idle(name):
+    try:
+        return media_storage.delete_idle(name)
+    except (SuspiciousFileOperation, OSError):
+        logger.warning('Не удалось удалить файл %s', name)
+        return False
+
+
+def release_files(names):
+    """Удаляет файлы, на которые больше не ссылается ни одна запись.
+
+    Ссылку из незафиксированной транзакции отсюда не видно, поэтому
+    недавно сохраненные файлы остаются (см. delete_idle); их потом
+    убирает sweep_media.
+    """
+    for name in set(filter(None, names)):
+        if not references(name):
+            delete_idle(name)
+
+
+def media_names(directory=MEDIA_DIRECTORY):
+    """Имена всех файлов хранилища медиа в directory и глубже."""
+    if not media_storage.exists(directory):
+        return
+    directories, files = media_storage.listdir(directory)
+    for name in files:
+        yield f'{directory}/{name}'
+    for subdirectory in directories:
+        yield from media_names(f'{directory}/{subdirectory}')
+
+
+def sweep_media():
+    """Удаляет давно не тронутые файлы без ссылок, возвращает их число.
+
+    Ссылки проверяются пачками по SWEEP_BATCH имен, по запросу на поле.
+    """
+    names = media_names()
+    removed = 0
+    while True:
+        batch = list(islice(names, SWEEP_BATCH))
+        if not batch:
+            return removed
+        used = referenced(batch)
+        for name in batch:
+            if name not in used and delete_idle(name):
+                removed += 1
+
+
+def release_on_commit(names):
+    names = list(names)
+    transaction.on_commit(lambda: release_files(names))
@@ -0,0 +1,29 @@
+# Generated by Django 2.2.16 on 2026-10-18 05:28
+
+from django.db import migrations, models
+import posts.storage
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0009_post_image_hash'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='post',
+            name='image',
+            field=models.ImageField(blank=True, storage=posts.storage.ContentAddressedStorage(), upload_to='posts/', verbose_name='Картинка'),
+        ),
+        migrations.AlterField(
+            model_name='post',
+            name='thumbnail',
+            field=models.ImageField(blank=True, editable=False, storage=posts.storage.ContentAddressedStorage(), upload_to='posts/thumbnails/', verbose_name='Миниатюра'),
+        ),
+        migrations.AlterField(
+            model_name='postrendition',
+            name='image',
+            field=models.ImageField(storage=posts.storage.ContentAddressedStorage(), upload_to='posts/renditions/', verbose_name='Картинка'),
+        ),
+    ]
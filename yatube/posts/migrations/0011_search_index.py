@@ -0,0 +1,55 @@
+# Generated by Django 2.2.16 on 2026-10-18 05:30
+
+from django.db import migrations
+
+from posts.stemmer import stem_words
+
+POST_INDEX = 'posts_post_fts'
+COMMENT_INDEX = 'posts_comment_fts'
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    Post = apps.get_model('posts', 'Post')
+    Comment = apps.get_model('posts', 'Comment')
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            f'CREATE VIRTUAL TABLE {POST_INDEX} '
+            f"USING fts5(body, tokenize='unicode61')")
+        cursor.execute(
+            f'CREATE VIRTUAL TABLE {COMMENT_INDEX} '
+            f"USING fts5(body, post_id UNINDEXED, tokenize='unicode61')")
+        cursor.executemany(
+            f'INSERT INTO {POST_INDEX} (rowid, body) VALUES (%s, %s)',
+            [
+                (pk, ' '.join(stem_words(text)))
+                for pk, text in Post.objects.values_list('pk', 'text')
+            ])
+        cursor.executemany(
+            f'INSERT INTO {COMMENT_INDEX} (rowid, body, post_id) '
+            f'VALUES (%s, %s, %s)',
+            [
+                (pk, ' '.join(stem_words(text)), post_id)
+                for pk, text, post_id in Comment.objects.values_list(
+                    'pk', 'text', 'post_id')
+            ])
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(f'DROP TABLE IF EXISTS {POST_INDEX}')
+        cursor.execute(f'DROP TABLE IF EXISTS {COMMENT_INDEX}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0010_content_addressed_media'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
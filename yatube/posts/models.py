@@ -1,6 +1,8 @@
 from django.contrib.auth import get_user_model
 from django.db import models
 
+from .storage import media_storage
+
 User = get_user_model()
 POST_COUNT = 16
 
@@ -45,17 +47,81 @@ class Post(models.Model):
     image = models.ImageField(
         'Картинка',
         upload_to='posts/',
-        blank=True
+        storage=media_storage,
+        blank=True,
+        db_index=True
+    )
+    image_hash = models.CharField(
+        'Хеш картинки',
+        max_length=64,
+        blank=True,
+        db_index=True,
+        editable=False
     )
+    thumbnail = models.ImageField(
+        'Миниатюра',
+        upload_to='posts/thumbnails/',
+        storage=media_storage,
+        blank=True,
+        db_index=True,
+        editable=False
+    )
+    comments_count = models.IntegerField(default=0, editable=False)
 
     class Meta:
         verbose_name = 'Пост'
         ordering = ['-pub_date']
         verbose_name_plural = 'Посты'
+        indexes = [
+            models.Index(
+                fields=['-pub_date'],
+                name='post_pub_date_idx'),
+            models.Index(
+                fields=['author', '-pub_date'],
+                name='post_author_pub_date_idx'),
+            models.Index(
+                fields=['group', '-pub_date'],
+                name='post_group_pub_date_idx'),
+        ]
 
     def __str__(self):
         return self.text[:POST_COUNT]
 
+    def save(self, force_insert=False, force_update=False, using=None,
+             update_fields=None):
+        """Сохраняет пост, не трогая comments_count у существующей записи.
+
+        Счетчик сдвигают атомарные UPDATE из сигналов комментариев, а
+        загруженный раньше экземпляр записал бы поверх устаревшее число.
+        """
+        if update_fields is None and not self._state.adding:
+            update_fields = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name != 'comments_count'
+            ]
+        super().save(force_insert, force_update, using, update_fields)
+
+
+class PostRendition(models.Model):
+    """Копия картинки поста заданной ширины в современном формате."""
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='renditions',
+    )
+    width = models.PositiveIntegerField('Ширина')
+    format = models.CharField('Формат', max_length=10)
+    image = models.ImageField(
+        'Картинка',
+        upload_to='posts/renditions/',
+        storage=media_storage,
+        db_index=True,
+    )
+
+    class Meta:
+        ordering = ['width']
+        unique_together = ('post', 'width', 'format')
+
 
 class Comment(models.Model):
     post = models.ForeignKey(
@@ -78,6 +144,11 @@ class Comment(models.Model):
         ordering = ['-created']
         verbose_name_plural = 'Коментарии'
         verbose_name = 'Коментарий'
+        indexes = [
+            models.Index(
+                fields=['post', '-created'],
+                name='comment_post_created_idx'),
+        ]
 
     def __str__(self):
         return self.text
@@ -90,3 +161,42 @@ class Follow(models.Model):
     author = models.ForeignKey(
         User, on_delete=models.CASCADE,
         related_name="following")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'author'],
+                name='unique_follow'),
+        ]
+
+
+class UserStats(models.Model):
+    """Счетчики пользователя; их сдвигают сигналы, чинит reconcile_counters."""
+    user = models.OneToOneField(
+        User, on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="stats")
+    posts_count = models.IntegerField(default=0)
+    followers_count = models.IntegerField(default=0)
+    following_count = models.IntegerField(default=0)
+
+
+class FeedEntry(models.Model):
+    """Запись ленты подписок: пост автора во "входящих" подписчика."""
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE,
+        related_name="feed")
+    post = models.ForeignKey(
+        Post, on_delete=models.CASCADE,
+        related_name="feed_entries")
+    pub_date = models.DateTimeField()
+
+    class Meta:
+        ordering = ['-pub_date']
+        unique_together = ('user', 'post')
+        indexes = [
+            # Ключ страницы ленты: (pub_date, post_id) внутри пользователя
+            models.Index(
+                fields=['user', '-pub_date', '-post'],
+                name='feed_user_pub_date_post_idx'),
+        ]
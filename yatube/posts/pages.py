@@ -0,0 +1,93 @@
+"""Кеш страниц целиком с "дырами" под персональные части.
+
+Страница собирается один раз для всех: вместо шапки и других частей,
+зависящих от пользователя, шаблонный тег hole оставляет метку. Готовое
+тело хранится в кеше под версией разделов, а метки на каждом запросе
+заменяются частями, отрисованными для текущего пользователя, - как
+<esi:include> у прокси, только внутри Django.
+"""
+import hashlib
+import json
+import re
+from functools import wraps
+from urllib.parse import urlencode
+
+from django.http import HttpResponse
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from .conditional import resolve_scopes
+from .fragments import fragment_version, get_or_build
+
+# Персональные части страниц: имя метки и шаблон
+HOLES = {
+    'header': 'includes/header.html',
+    'switcher': 'posts/includes/switcher.html',
+}
+HOLE = re.compile(r'<!--hole:(\w+):(\{.*?\})-->')
+# Параметры запроса, от которых зависит тело кешируемых страниц
+PAGE_PARAMS = ('page', 'after', 'before')
+
+
+def hole_marker(name, params):
+    # Текст постов экранируется, поэтому такую метку в нем не подделать
+    return mark_safe(f'<!--hole:{name}:{json.dumps(params)}-->')
+
+
+def fill_holes(body, request):
+    """Заменяет метки частями, отрисованными для пользователя запроса."""
+    return HOLE.sub(
+        lambda match: render_to_string(
+            HOLES[match[1]], json.loads(match[2]), request=request),
+        body,
+    )
+
+
+def page_key(request):
+    """Ключ тела: хеш пути и параметров страницы, прочие отбрасываются.
+
+    Так ключ ограничен по длине и не содержит недопустимых для memcached
+    символов, а мусорные параметры не плодят копий.
+    """
+    params = urlencode([
+        (name, request.GET[name]) for name in PAGE_PARAMS
+        if name in request.GET
+    ])
+    digest = hashlib.md5(f'{request.path}?{params}'.encode()).hexdigest()
+    return f'posts:page:{digest}'
+
+
+def cached_page(scopes):
+    """Кеширует тело страницы под версией разделов из scopes().
+
+    Тело одно на всех, поэтому его могут собирать и анонимы, и вошедшие
+    пользователи. Вместе с телом хранятся статус и заголовки ответа view,
+    кроме cookies.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            names = resolve_scopes(request, scopes, args, kwargs)
+            if request.method != 'GET' or names is None:
+                return view(request, *args, **kwargs)
+
+            def build():
+                request.punch_holes = True
+                try:
+                    response = view(request, *args, **kwargs)
+                finally:
+                    request.punch_holes = False
+                return (
+                    response.status_code,
+                    list(response.items()),
+                    response.content.decode(response.charset),
+                )
+
+            status, headers, body = get_or_build(
+                page_key(request), fragment_version(*names), build)
+            response = HttpResponse(fill_holes(body, request), status=status)
+            for name, value in headers:
+                response[name] = value
+            return response
+        return wrapper
+    return decorator
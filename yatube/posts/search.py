@@ -0,0 +1,137 @@
+from django.db import connection
+from django.db.models import Q
+
+from .models import Comment, Post
+from .stemmer import stem_words
+
+POST_INDEX = 'posts_post_fts'
+COMMENT_INDEX = 'posts_comment_fts'
+# Совпадение в комментарии весит вдвое меньше совпадения в тексте поста.
+COMMENT_WEIGHT = 0.5
+
+SEARCH_SQL = f'''
+    SELECT post_id, MIN(rank) AS best FROM (
+        SELECT rowid AS post_id, bm25({POST_INDEX}) AS rank
+        FROM {POST_INDEX} WHERE {POST_INDEX} MATCH %s
+        UNION ALL
+        SELECT post_id, bm25({COMMENT_INDEX}) * {COMMENT_WEIGHT}
+        FROM {COMMENT_INDEX} WHERE {COMMENT_INDEX} MATCH %s
+    ) GROUP BY post_id ORDER BY best LIMIT %s OFFSET %s
+'''
+
+
+def fts_available():
+    return connection.vendor == 'sqlite'
+
+
+def create_index(cursor):
+    cursor.execute(
+        f'CREATE VIRTUAL TABLE IF NOT EXISTS {POST_INDEX} '
+        f"USING fts5(body, tokenize='unicode61')")
+    cursor.execute(
+        f'CREATE VIRTUAL TABLE IF NOT EXISTS {COMMENT_INDEX} '
+        f"USING fts5(body, post_id UNINDEXED, tokenize='unicode61')")
+
+
+def drop_index(cursor):
+    cursor.execute(f'DROP TABLE IF EXISTS {POST_INDEX}')
+    cursor.execute(f'DROP TABLE IF EXISTS {COMMENT_INDEX}')
+
+
+def to_document(text):
+    return ' '.join(stem_words(text))
+
+
+def to_query(text):
+    """Запрос FTS5: все основы слов, каждая как префикс."""
+    return ' '.join(f'"{word}"*' for word in stem_words(text))
+
+
+def index_post(post):
+    if not fts_available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {POST_INDEX} WHERE rowid = %s', [post.pk])
+        cursor.execute(
+            f'INSERT INTO {POST_INDEX} (rowid, body) VALUES (%s, %s)',
+            [post.pk, to_document(post.text)])
+
+
+def unindex_post(post_id):
+    if not fts_available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {POST_INDEX} WHERE rowid = %s', [post_id])
+
+
+def index_comment(comment):
+    if not fts_available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {COMMENT_INDEX} WHERE rowid = %s', [comment.pk])
+        cursor.execute(
+            f'INSERT INTO {COMMENT_INDEX} (rowid, body, post_id) '
+            f'VALUES (%s, %s, %s)',
+            [comment.pk, to_document(comment.text), comment.post_id])
+
+
+def unindex_comment(comment_id):
+    if not fts_available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {COMMENT_INDEX} WHERE rowid = %s', [comment_id])
+
+
+def rebuild_index(batch_size=2000):
+    """Пересоздает индекс по всем постам и комментариям."""
+    with connection.cursor() as cursor:
+        drop_index(cursor)
+        create_index(cursor)
+        for model, table, fields in (
+                (Post, POST_INDEX, ('pk', 'text')),
+                (Comment, COMMENT_INDEX, ('pk', 'text', 'post_id'))):
+            rows = model.objects.order_by().values_list(*fields)
+            columns = 'rowid, body' + (', post_id' if len(fields) > 2 else '')
+            marks = ', '.join(['%s'] * len(fields))
+            batch = []
+            for row in rows.iterator(chunk_size=batch_size):
+                batch.append((row[0], to_document(row[1]), *row[2:]))
+                if len(batch) == batch_size:
+                    cursor.executemany(
+                        f'INSERT INTO {table} ({columns}) VALUES ({marks})',
+                        batch)
+                    batch = []
+            if batch:
+                cursor.executemany(
+                    f'INSERT INTO {table} ({columns}) VALUES ({marks})',
+                    batch)
+
+
+def search_post_ids(text, limit, offset=0):
+    """id постов по убыванию релевантности текста и комментариев."""
+    query = to_query(text)
+    if not query:
+        return []
+    if not fts_available():
+        words = stem_words(text)
+        condition = Q()
+        for word in words:
+            condition &= (
+                Q(text__icontains=word) | Q(comments__text__icontains=word))
+        return list(
+            Post.objects.filter(condition).order_by('-pub_date').values_list(
+                'pk', flat=True).distinct()[offset:offset + limit])
+    with connection.cursor() as cursor:
+        cursor.execute(SEARCH_SQL, [query, query, limit, offset])
+        return [row[0] for row in cursor.fetchall()]
+
+
+def search_posts(text, limit, offset=0):
+    """Посты в порядке релевантности с авторами и группами."""
+    post_ids = search_post_ids(text, limit, offset)
+    posts = Post.objects.select_related('author', 'group').in_bulk(post_ids)
+    return [posts[pk] for pk in post_ids if pk in posts]
@@ -0,0 +1,93 @@
+from django.db import connection
+
+from .counters import reconcile_comment_counters, reconcile_user_counters
+from .feeds import backfill_feed
+from .models import Comment, Follow, Group, Post, User
+
+BATCH_SIZE = 10000
+PREFIX = 'bench_'
+PROLIFIC = f'{PREFIX}prolific'
+# Комментарии раскладываются по самым свежим постам
+COMMENTED_POSTS = 1000
+
+
+def seed(posts, authors, groups, comments=0, follows=0, report=print):
+    """Досоздает недостающие тестовые записи пачками через bulk_create.
+
+    Сигналы при этом не отправляются, поэтому ленты подписок и счетчики
+    досчитываются здесь же.
+    """
+    users = User.objects.filter(username__startswith=PREFIX)
+    # Размер пачки bulk_create выбирает сам: SQLite собирает INSERT из
+    # UNION ALL SELECT, а в одном составном SELECT не больше 500 частей
+    User.objects.bulk_create(
+        [User(username=f'{PREFIX}{i}')
+         for i in range(users.count(), authors)])
+    Group.objects.bulk_create(
+        [Group(title=f'{PREFIX}{i}', slug=f'{PREFIX}{i}')
+         for i in range(Group.objects.count(), groups)])
+    author_ids = list(users.order_by('pk').values_list('pk', flat=True))
+    group_ids = list(Group.objects.values_list('pk', flat=True))
+    existing_posts = Post.objects.count()
+    for start in range(existing_posts, posts, BATCH_SIZE):
+        Post.objects.bulk_create([
+            Post(
+                text=f'Пост {i}',
+                author_id=author_ids[i % len(author_ids)],
+                group_id=group_ids[i % len(group_ids)],
+            )
+            for i in range(start, min(start + BATCH_SIZE, posts))
+        ])
+        report(f'Создано постов: {min(start + BATCH_SIZE, posts)}')
+
+    post_ids = list(
+        Post.objects.values_list('pk', flat=True)[:COMMENTED_POSTS])
+    for start in range(Comment.objects.count(), comments, BATCH_SIZE):
+        Comment.objects.bulk_create([
+            Comment(
+                text=f'Комментарий {i}',
+                post_id=post_ids[i % len(post_ids)],
+                author_id=author_ids[i % len(author_ids)],
+            )
+            for i in range(start, min(start + BATCH_SIZE, comments))
+        ])
+        report(f'Создано комментариев: {min(start + BATCH_SIZE, comments)}')
+
+    # Пара номер i: подписчик i % n на автора через i // n + 1 от него
+    count = len(author_ids)
+    follows = min(follows, count * (count - 1))
+    new_follows = [
+        Follow(
+            user_id=author_ids[i % count],
+            author_id=author_ids[(i % count + i // count + 1) % count],
+        )
+        for i in range(Follow.objects.filter(
+            user__username__startswith=PREFIX).count(), follows)
+    ]
+    Follow.objects.bulk_create(new_follows, ignore_conflicts=True)
+    # Новые посты нужны и в лентах подписок с прошлых запусков
+    if posts > existing_posts:
+        new_follows = Follow.objects.filter(
+            user__username__startswith=PREFIX)
+    for follow in new_follows:
+        backfill_feed(follow.user_id, follow.author_id)
+    reconcile_user_counters()
+    reconcile_comment_counters()
+
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE')
+
+
+def seed_prolific(posts, report=print):
+    """Досоздает автора PROLIFIC с `posts` постами без группы."""
+    author, _ = User.objects.get_or_create(username=PROLIFIC)
+    for start in range(author.posts.count(), posts, BATCH_SIZE):
+        Post.objects.bulk_create([
+            Post(text=f'Пост автора {i}', author=author)
+            for i in range(start, min(start + BATCH_SIZE, posts))
+        ])
+        report(f'Создано постов автора: {min(start + BATCH_SIZE, posts)}')
+    for follow in Follow.objects.filter(author=author):
+        backfill_feed(follow.user_id, follow.author_id)
+    reconcile_user_counters([author.pk])
+    return author
@@ -0,0 +1,178 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .counters import change_comments_count, change_user_counters
+from .feeds import backfill_feed, prune_feed, push_post
+from .fragments import bump_versions
+from .media import release_on_commit
+from .models import (Comment, Follow, Group, Post, PostRendition, User,
+                     UserStats)
+from .search import index_comment, index_post, unindex_comment, unindex_post
+from .utils import change_counts, reset_counts
+
+
+# Поля пользователя, которые выводятся рядом с его постами
+AUTHOR_FIELDS = {'username', 'first_name', 'last_name'}
+
+
+def follower_ids(author_id):
+    return list(Follow.objects.filter(
+        author_id=author_id).values_list('user_id', flat=True))
+
+
+def post_scopes(post, followers):
+    """Разделы ленты, в которые попадает пост."""
+    scopes = ['index', f'author:{post.author_id}']
+    if post.group_id:
+        scopes.append(f'group:{post.group_id}')
+    scopes.extend(f'follower:{user_id}' for user_id in followers)
+    return scopes
+
+
+def fragment_scopes(post, old_group_id=None):
+    """Разделы, чьи закешированные фрагменты показывают пост."""
+    scopes = ['index', f'author:{post.author_id}', f'post:{post.pk}']
+    for group_id in {post.group_id, old_group_id}:
+        if group_id:
+            scopes.append(f'group:{group_id}')
+    return scopes
+
+
+def feed_scopes(followers):
+    """Разделы лент подписок, версии которых отдает API."""
+    return [f'follower:{user_id}' for user_id in followers]
+
+
+def follow_scopes(follow):
+    """Лента подписчика и счетчики обоих пользователей."""
+    return (
+        feed_scopes([follow.user_id])
+        + [f'stats:{follow.user_id}', f'stats:{follow.author_id}']
+    )
+
+
+@receiver(pre_save, sender=Post)
+def remember_old_values(sender, instance, **kwargs):
+    """Запоминает прежние группу и файлы поста перед редактированием."""
+    instance._old_group_id = None
+    instance._old_files = ()
+    if instance.pk is None:
+        return
+    old = Post.objects.filter(pk=instance.pk).values_list(
+        'group_id', 'image', 'thumbnail').first()
+    if old is not None:
+        instance._old_group_id, *instance._old_files = old
+
+
+@receiver(post_save, sender=Post)
+def post_saved(sender, instance, created, raw=False, update_fields=None,
+               **kwargs):
+    if raw:
+        return
+    old_group_id = getattr(instance, '_old_group_id', None)
+    followers = follower_ids(instance.author_id)
+    bump_versions(
+        fragment_scopes(instance, old_group_id) + feed_scopes(followers))
+    if update_fields is None or 'text' in update_fields:
+        index_post(instance)
+    if created:
+        push_post(instance, followers)
+        change_counts(post_scopes(instance, followers), 1)
+        change_user_counters(instance.author_id, posts_count=1)
+        return
+    current_files = {instance.image.name, instance.thumbnail.name}
+    release_on_commit(
+        name for name in getattr(instance, '_old_files', ())
+        if name not in current_files)
+    if old_group_id != instance.group_id:
+        if old_group_id:
+            change_counts([f'group:{old_group_id}'], -1)
+        if instance.group_id:
+            change_counts([f'group:{instance.group_id}'], 1)
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    followers = follower_ids(instance.author_id)
+    bump_versions(fragment_scopes(instance) + feed_scopes(followers))
+    unindex_post(instance.pk)
+    release_on_commit([instance.image.name, instance.thumbnail.name])
+    change_counts(post_scopes(instance, followers), -1)
+    change_user_counters(instance.author_id, posts_count=-1)
+
+
+@receiver(post_delete, sender=PostRendition)
+def rendition_deleted(sender, instance, **kwargs):
+    release_on_commit([instance.image.name])
+
+
+@receiver(post_save, sender=Comment)
+def comment_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    bump_versions([f'post:{instance.post_id}'])
+    index_comment(instance)
+    if created:
+        change_comments_count(instance.post_id, 1)
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    bump_versions([f'post:{instance.post_id}'])
+    unindex_comment(instance.pk)
+    change_comments_count(instance.post_id, -1)
+
+
+@receiver(post_save, sender=Group)
+def group_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        bump_versions(['index', 'groups', f'group:{instance.pk}'])
+
+
+@receiver(post_delete, sender=Group)
+def group_deleted(sender, instance, **kwargs):
+    bump_versions(['index', 'groups', f'group:{instance.pk}'])
+    reset_counts([f'group:{instance.pk}'])
+
+
+@receiver(post_save, sender=Follow)
+def fill_follower_feed(sender, instance, created, raw=False, **kwargs):
+    if raw or not created:
+        return
+    backfill_feed(instance.user_id, instance.author_id)
+    reset_counts([f'follower:{instance.user_id}'])
+    bump_versions(follow_scopes(instance))
+    change_user_counters(instance.user_id, following_count=1)
+    change_user_counters(instance.author_id, followers_count=1)
+
+
+@receiver(post_delete, sender=Follow)
+def prune_follower_feed(sender, instance, **kwargs):
+    prune_feed(instance.user_id, instance.author_id)
+    reset_counts([f'follower:{instance.user_id}'])
+    bump_versions(follow_scopes(instance))
+    change_user_counters(instance.user_id, following_count=-1)
+    change_user_counters(instance.author_id, followers_count=-1)
+
+
+@receiver(post_save, sender=User)
+def create_user_stats(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        UserStats.objects.get_or_create(user=instance)
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, raw=False, update_fields=None,
+               **kwargs):
+    """Имя автора видно на всех лентах с его постами и в его профиле.
+
+    Сохранения без этих полей, например last_login при входе, версии
+    не трогают.
+    """
+    if raw or created:
+        return
+    if update_fields is not None and not AUTHOR_FIELDS & set(update_fields):
+        return
+    bump_versions(
+        ['index', 'groups', f'author:{instance.pk}', f'stats:{instance.pk}']
+        + feed_scopes(follower_ids(instance.pk)))
@@ -0,0 +1,122 @@
+"""Стеммер Портера (Snowball) для русского языка."""
+import re
+
+VOWELS = 'аеиоуыэюя'
+
+PERFECTIVE_GERUND = (
+    ('в', 'вши', 'вшись'),
+    ('ив', 'ивши', 'ившись', 'ыв', 'ывши', 'ывшись'),
+)
+REFLEXIVE = ((), ('ся', 'сь'))
+ADJECTIVE = ((), (
+    'ее', 'ие', 'ые', 'ое', 'ими', 'ыми', 'ей', 'ий', 'ый', 'ой', 'ем',
+    'им', 'ым', 'ом', 'его', 'ого', 'ему', 'ому', 'их', 'ых', 'ую', 'юю',
+    'ая', 'яя', 'ою', 'ею',
+))
+PARTICIPLE = (
+    ('ем', 'нн', 'вш', 'ющ', 'щ'),
+    ('ивш', 'ывш', 'ующ'),
+)
+VERB = (
+    ('ла', 'на', 'ете', 'йте', 'ли', 'й', 'л', 'ем', 'н', 'ло', 'но', 'ет',
+     'ют', 'ны', 'ть', 'ешь', 'нно'),
+    ('ила', 'ыла', 'ена', 'ейте', 'уйте', 'ите', 'или', 'ыли', 'ей', 'уй',
+     'ил', 'ыл', 'им', 'ым', 'ен', 'ило', 'ыло', 'ено', 'ят', 'ует', 'уют',
+     'ит', 'ыт', 'ены', 'ить', 'ыть', 'ишь', 'ую', 'ю'),
+)
+NOUN = ((), (
+    'а', 'ев', 'ов', 'ие', 'ье', 'е', 'иями', 'ями', 'ами', 'еи', 'ии', 'и',
+    'ией', 'ей', 'ой', 'ий', 'й', 'иям', 'ям', 'ием', 'ем', 'ам', 'ом', 'о',
+    'у', 'ах', 'иях', 'ях', 'ы', 'ь', 'ию', 'ью', 'ю', 'ия', 'ья', 'я',
+))
+DERIVATIONAL = ((), ('ост', 'ость'))
+SUPERLATIVE = ((), ('ейш', 'ейше'))
+
+WORD_RE = re.compile(r'\w+')
+
+
+def _regions(word):
+    """Начала областей RV и R2 по правилам Snowball."""
+    rv = r1 = r2 = len(word)
+    for i, letter in enumerate(word):
+        if letter in VOWELS:
+            rv = i + 1
+            break
+    for i in range(1, len(word)):
+        if word[i] not in VOWELS and word[i - 1] in VOWELS:
+            r1 = i + 1
+            break
+    for i in range(r1 + 1, len(word)):
+        if word[i] not in VOWELS and word[i - 1] in VOWELS:
+            r2 = i + 1
+            break
+    return rv, r2
+
+
+def _strip(region, endings):
+    """Срезает самое длинное окончание из группы или возвращает None.
+
+    Окончания первой группы срезаются только после «а» или «я».
+    """
+    after_a, plain = endings
+    found = max(
+        (ending for ending in after_a + plain if region.endswith(ending)),
+        key=len, default=None)
+    if found is None:
+        return None
+    rest = region[:-len(found)]
+    if found in after_a and found not in plain and (
+            not rest or rest[-1] not in 'ая'):
+        return None
+    return rest
+
+
+def _strip_inflection(region):
+    """Шаг 1: деепричастие, либо возвратность с прилагательным,
+    глаголом или существительным."""
+    rest = _strip(region, PERFECTIVE_GERUND)
+    if rest is not None:
+        return rest
+    reflexive = _strip(region, REFLEXIVE)
+    if reflexive is not None:
+        region = reflexive
+    rest = _strip(region, ADJECTIVE)
+    if rest is not None:
+        participle = _strip(rest, PARTICIPLE)
+        return rest if participle is None else participle
+    rest = _strip(region, VERB)
+    if rest is None:
+        rest = _strip(region, NOUN)
+    return region if rest is None else rest
+
+
+def stem(word):
+    word = word.lower().replace('ё', 'е')
+    rv, r2 = _regions(word)
+    prefix, region = word[:rv], word[rv:]
+    region = _strip_inflection(region)
+
+    if region.endswith('и'):
+        region = region[:-1]
+
+    r2_start = max(r2 - rv, 0)
+    rest = _strip(region[r2_start:], DERIVATIONAL)
+    if rest is not None:
+        region = region[:r2_start] + rest
+
+    if region.endswith('нн'):
+        region = region[:-1]
+    else:
+        rest = _strip(region, SUPERLATIVE)
+        if rest is not None:
+            region = rest
+            if region.endswith('нн'):
+                region = region[:-1]
+        elif region.endswith('ь'):
+            region = region[:-1]
+    return prefix + region
+
+
+def stem_words(text):
+    """Основы всех слов текста в исходном порядке."""
+    return [stem(word) for word in WORD_RE.findall(text)]
@@ -0,0 +1,73 @@
+import hashlib
+import os
+import time
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+
+# Файл, записанный или переиспользованный недавно, может принадлежать
+# еще не зафиксированной транзакции, поэтому его не удаляют
+IDLE_SECONDS = 60 * 10
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """Хранит файлы под именем sha256 их содержимого.
+
+    Файл раскладывается по подкаталогам из первых символов хеша:
+    posts/ab/cd/abcd….jpg. Одинаковое содержимое попадает в один файл,
+    и повторная запись не происходит: у существующего файла только
+    обновляется время изменения, чтобы delete_idle его не тронул.
+    """
+
+    def hashed_name(self, name, content):
+        sha256 = hashlib.sha256()
+        for chunk in content.chunks():
+            sha256.update(chunk)
+        content.seek(0)
+        digest = sha256.hexdigest()
+        directory = os.path.dirname(name)
+        extension = os.path.splitext(name)[1].lower()
+        return os.path.join(
+            directory, digest[:2], digest[2:4], f'{digest}{extension}'
+        ).replace('\\', '/')
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = self.hashed_name(self.generate_filename(name), content)
+        if self.touch(name):
+            return name
+        return self._save(name, content)
+
+    def touch(self, name):
+        """Обновляет время изменения файла; False, если файла нет."""
+        try:
+            os.utime(self.path(name))
+        except FileNotFoundError:
+            return False
+        return True
+
+    def delete_idle(self, name, idle=IDLE_SECONDS):
+        """Удаляет файл, если его не записывали и не касались idle секунд.
+
+        Файл сначала атомарно переименовывается: save, успевший коснуться
+        его до переименования, виден по времени, и файл возвращается на
+        место, а save после переименования запишет файл заново.
+        """
+        path = self.path(name)
+        trash = f'{path}.deleting'
+        try:
+            os.rename(path, trash)
+        except FileNotFoundError:
+            return False
+        if time.time() - os.path.getmtime(trash) < idle:
+            # Содержимое то же, поэтому можно заменить и свежую запись
+            os.replace(trash, path)
+            return False
+        os.remove(trash)
+        return True
+
+
+media_storage = ContentAddressedStorage()
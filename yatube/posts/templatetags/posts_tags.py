@@ -0,0 +1,96 @@
+from django import template
+from django.core.cache.utils import make_template_fragment_key
+
+from ..fragments import get_or_build
+from ..models import Post
+from ..pages import HOLES, hole_marker
+from ..thumbnails import prefetch_legacy_thumbnails, prefetch_renditions
+
+register = template.Library()
+
+
+class FragmentCacheNode(template.Node):
+    def __init__(self, nodelist, fragment_name, version, vary_on):
+        self.nodelist = nodelist
+        self.fragment_name = fragment_name
+        self.version = version
+        self.vary_on = vary_on
+
+    def render(self, context):
+        vary_on = [var.resolve(context) for var in self.vary_on]
+        key = make_template_fragment_key(self.fragment_name, vary_on)
+        return get_or_build(
+            key,
+            self.version.resolve(context),
+            lambda: self.nodelist.render(context),
+        )
+
+
+@register.tag('fragment_cache')
+def do_fragment_cache(parser, token):
+    """Кеширует фрагмент шаблона с учетом версии раздела.
+
+        {% fragment_cache index_page cache_version request.GET.urlencode %}
+            ...
+        {% endfragment_cache %}
+    """
+    nodelist = parser.parse(('endfragment_cache',))
+    parser.delete_first_token()
+    bits = token.split_contents()
+    if len(bits) < 3:
+        raise template.TemplateSyntaxError(
+            f"'{bits[0]}' tag requires at least 2 arguments.")
+    return FragmentCacheNode(
+        nodelist,
+        bits[1],
+        parser.compile_filter(bits[2]),
+        [parser.compile_filter(bit) for bit in bits[3:]],
+    )
+
+
+@register.simple_tag(takes_context=True)
+def hole(context, name, **params):
+    """Часть страницы, своя у каждого пользователя.
+
+        {% hole 'switcher' index=True %}
+
+    Пока cached_page собирает общее тело страницы, вместо части выводится
+    метка, иначе часть рисуется на месте, как include.
+    """
+    request = context.get('request')
+    if getattr(request, 'punch_holes', False):
+        return hole_marker(name, params)
+    template = context.template.engine.get_template(HOLES[name])
+    with context.push(**params):
+        return template.render(context)
+
+
+@register.simple_tag
+def prefetch_thumbnails(posts):
+    """Готовит миниатюры всех постов страницы до цикла по ним.
+
+    Может поставить в фоновую очередь миниатюры старых постов, см.
+    prefetch_legacy_thumbnails.
+    """
+    if isinstance(posts, Post):
+        posts = [posts]
+    prefetch_legacy_thumbnails(posts)
+    prefetch_renditions(posts)
+    return ''
+
+
+@register.inclusion_tag('posts/includes/picture.html')
+def picture(post, sizes='(max-width: 960px) 100vw, 960px'):
+    """<picture> с srcset по форматам из подготовленных копий поста."""
+    sources = {}
+    for rendition in getattr(post, 'rendition_list', []):
+        sources.setdefault(rendition.format, []).append(
+            f'{rendition.image.url} {rendition.width}w')
+    return {
+        'post': post,
+        'sizes': sizes,
+        'sources': [
+            (f'image/{format.lower()}', ', '.join(srcset))
+            for format, srcset in sources.items()
+        ],
+    }
@@ -0,0 +1,111 @@
+from django.core.cache import cache
+from django.test import Client, TestCase
+from django.urls import reverse
+
+from ..models import Comment, Follow, Group, Post, User
+from ..utils import POST_NUMBER
+
+
+class ApiTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='Группа', slug='group', description='Описание')
+        Post.objects.bulk_create([
+            Post(author=cls.author, group=cls.group, text=f'Пост {i}')
+            for i in range(POST_NUMBER + 3)
+        ])
+        cls.post = Post.objects.create(
+            author=cls.author, group=cls.group, text='Последний пост')
+
+    def setUp(self):
+        cache.clear()
+        self.reader_client = Client()
+        self.reader_client.force_login(self.reader)
+
+    def test_pages_mirror_html_views(self):
+        """Все эндпоинты отвечают JSON с постами и курсором."""
+        urls = {
+            reverse('api:index'): 'results',
+            reverse('api:group_list', args=[self.group.slug]): 'group',
+            reverse('api:profile', args=[self.author.username]): 'author',
+            reverse('api:post_detail', args=[self.post.pk]): 'comments',
+            reverse('api:follow_index'): 'results',
+        }
+        for url, key in urls.items():
+            with self.subTest(url=url):
+                response = self.reader_client.get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertIn(key, response.json())
+
+    def test_cursor_pagination(self):
+        """Вторая страница идет после курсора первой без повторов."""
+        url = reverse('api:index')
+        first = self.client.get(url).json()
+        self.assertEqual(len(first['results']), POST_NUMBER)
+        self.assertEqual(first['results'][0]['id'], self.post.pk)
+        second = self.client.get(url, {'after': first['next']}).json()
+        self.assertEqual(len(second['results']), 4)
+        self.assertIsNone(second['next'])
+        self.assertFalse(
+            {post['id'] for post in first['results']}
+            & {post['id'] for post in second['results']})
+
+    def test_not_modified_without_queries(self):
+        """Совпавший ETag дает 304 без единого SQL-запроса."""
+        url = reverse('api:index')
+        response = self.client.get(url)
+        etag = response['ETag']
+        self.assertTrue(etag.startswith('"'))
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+    def test_if_modified_since_is_ignored(self):
+        """Без Last-Modified изменение в ту же секунду не дает ложный 304."""
+        url = reverse('api:index')
+        response = self.client.get(url)
+        self.assertNotIn('Last-Modified', response)
+        Post.objects.create(author=self.author, text='Свежий пост')
+        response = self.client.get(
+            url, HTTP_IF_MODIFIED_SINCE='Thu, 01 Jan 2099 00:00:00 GMT')
+        self.assertEqual(response.status_code, 200)
+
+    def test_etag_changes_with_content(self):
+        """Новый комментарий меняет ETag поста, а ETag страниц различны."""
+        url = reverse('api:post_detail', args=[self.post.pk])
+        etag = self.client.get(url)['ETag']
+        self.assertNotEqual(
+            self.client.get(url, {'after': 'x'})['ETag'], etag)
+        Comment.objects.create(
+            post=self.post, author=self.reader, text='Комментарий')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['comments_count'], 1)
+
+    def test_follow_feed_is_private(self):
+        """Лента подписок требует входа и меняется при подписке."""
+        url = reverse('api:follow_index')
+        self.assertEqual(self.client.get(url).status_code, 401)
+        response = self.reader_client.get(url)
+        self.assertEqual(response.json()['results'], [])
+        self.assertIn('private', response['Cache-Control'])
+        Follow.objects.create(user=self.reader, author=self.author)
+        response = self.reader_client.get(
+            url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['results']), POST_NUMBER)
+
+    def test_missing_objects(self):
+        """Несуществующие группа, автор и пост дают 404."""
+        for url in (
+            reverse('api:group_list', args=['missing']),
+            reverse('api:profile', args=['missing']),
+            reverse('api:post_detail', args=[0]),
+        ):
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url).status_code, 404)
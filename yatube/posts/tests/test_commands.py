@@ -0,0 +1,217 @@
+import csv
+import gzip
+import io
+import json
+import shutil
+import tempfile
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
+
+from ..management.commands.import_data import iter_json_array
+from ..models import Comment, Follow, Group, Post, User
+from ..search import search_post_ids
+from ..seed import PREFIX, seed
+
+DATA = Path(settings.BASE_DIR) / 'data.json'
+
+
+class ImportDataTests(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.fixture = Path(self.tmp_dir) / 'data.json'
+        shutil.copy(DATA, self.fixture)
+        self.items = json.loads(DATA.read_text(encoding='utf-8'))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def load(self, **options):
+        call_command(
+            'import_data', str(self.fixture), batch_size=7,
+            keep_indexes=True, stdout=io.StringIO(), **options)
+
+    def test_stream_parser_matches_json(self):
+        """Потоковый разбор дает те же объекты, что и json.load."""
+        with open(DATA, encoding='utf-8') as stream:
+            items = list(iter_json_array(stream, chunk_size=100))
+        self.assertEqual(items, self.items)
+
+    def test_import_keeps_fixture_values(self):
+        """Загрузка сохраняет ключи и даты фикстуры и строит индексы."""
+        self.load()
+        posts = [item for item in self.items if item['model'] == 'posts.post']
+        self.assertEqual(Post.objects.count(), len(posts))
+        post = Post.objects.get(pk=posts[0]['pk'])
+        self.assertEqual(
+            post.pub_date.isoformat().replace('+00:00', 'Z')[:19],
+            posts[0]['fields']['pub_date'][:19])
+        self.assertIn(post.pk, search_post_ids(post.text.split()[0], 50))
+        self.assertFalse(Path(f'{self.fixture}.progress').exists())
+
+    def test_import_resumes_and_repeats(self):
+        """Продолжение пропускает загруженное, повтор не дублирует."""
+        users = [item for item in self.items if item['model'] == 'auth.user']
+        self.fixture.write_text(json.dumps(users), encoding='utf-8')
+        self.load()
+        User.objects.filter(pk=users[0]['pk']).delete()
+        shutil.copy(DATA, self.fixture)
+        Path(f'{self.fixture}.progress').write_text(
+            json.dumps({'loaded': len(users)}))
+        self.load(resume=True)
+        self.assertEqual(User.objects.count(), len(users) - 1)
+        self.load()
+        self.assertEqual(User.objects.count(), len(users))
+        self.assertEqual(Post.objects.count(), len(self.items) - len(users))
+
+    def test_import_fills_feeds(self):
+        """Подписчики получают загруженные посты в ленту."""
+        reader = User.objects.create(username='reader')
+        author = User.objects.create(username='author')
+        Follow.objects.create(user=reader, author=author)
+        self.fixture.write_text(json.dumps([{
+            'model': 'posts.post', 'pk': 1000,
+            'fields': {'text': 'Из дампа', 'author': author.pk,
+                       'pub_date': '2020-01-01T00:00:00Z'},
+        }]), encoding='utf-8')
+        self.load()
+        self.assertTrue(reader.feed.filter(post_id=1000).exists())
+
+
+class ExportDataTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create(username='author')
+        cls.reader = User.objects.create(username='reader')
+        cls.group = Group.objects.create(title='Группа', slug='group')
+        cls.post = Post.objects.create(
+            author=cls.author, group=cls.group, text='Первый пост')
+        Comment.objects.create(
+            post=cls.post, author=cls.reader, text='Комментарий')
+        Follow.objects.create(user=cls.reader, author=cls.author)
+
+    def setUp(self):
+        self.tmp_dir = Path(tempfile.mkdtemp())
+        self.watermark = self.tmp_dir / 'watermark.json'
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def export(self, name, **options):
+        call_command(
+            'export_data', str(self.tmp_dir / name), chunk_size=1,
+            stdout=io.StringIO(), **options)
+        return self.tmp_dir / name
+
+    def read_ndjson(self, path):
+        with gzip.open(path, 'rt', encoding='utf-8') as stream:
+            return [json.loads(line) for line in stream]
+
+    def test_export_ndjson_gzip(self):
+        """NDJSON повторяет формат dumpdata и сжимается на лету."""
+        out = self.export('full', compress=True)
+        posts = self.read_ndjson(out / 'post.ndjson.gz')
+        self.assertEqual(len(posts), 1)
+        self.assertEqual(posts[0]['model'], 'posts.post')
+        self.assertEqual(posts[0]['pk'], self.post.pk)
+        self.assertEqual(posts[0]['fields']['author'], self.author.pk)
+        self.assertEqual(posts[0]['fields']['text'], self.post.text)
+        for name in ('group', 'comment', 'follow'):
+            self.assertEqual(
+                len(self.read_ndjson(out / f'{name}.ndjson.gz')), 1)
+
+    def test_export_csv(self):
+        """CSV содержит заголовок и по строке на запись."""
+        out = self.export('csv', output_format='csv')
+        with open(out / 'comment.csv', encoding='utf-8') as stream:
+            rows = list(csv.DictReader(stream))
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]['post_id'], str(self.post.pk))
+        self.assertEqual(rows[0]['text'], 'Комментарий')
+
+    def test_export_continues_from_watermark(self):
+        """Повторная выгрузка с водяным знаком отдает только новое."""
+        self.export('first', compress=True, watermark=str(self.watermark))
+        post = Post.objects.create(author=self.author, text='Второй пост')
+        out = self.export(
+            'second', compress=True, watermark=str(self.watermark))
+        posts = self.read_ndjson(out / 'post.ndjson.gz')
+        self.assertEqual([item['pk'] for item in posts], [post.pk])
+        self.assertEqual(self.read_ndjson(out / 'follow.ndjson.gz'), [])
+        marks = json.loads(self.watermark.read_text())
+        self.assertEqual(marks['posts.post']['pk'], post.pk)
+
+
+class SeedTests(TestCase):
+    def test_seed_more_rows_than_one_insert_holds(self):
+        """Авторы и группы сверх предела одного INSERT в SQLite создаются."""
+        seed(posts=0, authors=600, groups=600, report=lambda message: None)
+        self.assertEqual(
+            User.objects.filter(username__startswith=PREFIX).count(), 600)
+        self.assertEqual(Group.objects.count(), 600)
+
+
+class BenchmarkTests(TestCase):
+    def setUp(self):
+        self.tmp_dir = Path(tempfile.mkdtemp())
+        self.baseline = self.tmp_dir / 'baseline.json'
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def run_benchmark(self, **options):
+        call_command(
+            'benchmark', users=3, groups=1, posts=6, comments=3, follows=2,
+            author_posts=25, requests=2, baseline=str(self.baseline),
+            in_place=True, stdout=io.StringIO(), **options)
+
+    def test_benchmark_needs_database_choice(self):
+        """Без выбора базы бенчмарк ничего не пишет."""
+        with self.assertRaisesMessage(CommandError, '--test-database'):
+            call_command('benchmark', stdout=io.StringIO())
+        self.assertFalse(User.objects.exists())
+
+    def test_seed_fills_existing_feeds(self):
+        """Посты повторного заполнения попадают в ленты старых подписок."""
+        seed(posts=2, authors=2, groups=1, follows=2,
+             report=lambda message: None)
+        seed(posts=6, authors=2, groups=1, follows=2,
+             report=lambda message: None)
+        for follow in Follow.objects.all():
+            with self.subTest(user=follow.user_id):
+                self.assertEqual(
+                    follow.user.feed.count(), follow.author.posts.count())
+
+    def test_benchmark_saves_and_checks_baseline(self):
+        """Эталон покрывает все маршруты, рост числа запросов ловится."""
+        self.run_benchmark(save_baseline=True)
+        results = json.loads(self.baseline.read_text())
+        self.assertIn('follow_index', results)
+        self.assertIn('add_comment', results)
+        self.assertIn('profile_prolific_middle', results)
+        self.assertEqual(
+            set(results['index']),
+            {'p50', 'p95', 'p99', 'queries', 'alloc_kb'})
+        results['index']['queries'] = 0
+        self.baseline.write_text(json.dumps(results))
+        with self.assertRaisesMessage(CommandError, 'index: запросов'):
+            self.run_benchmark(tolerance=1000)
+
+
+class ExplainFeedsTests(TransactionTestCase):
+    def test_explain_leaves_database_untouched(self):
+        """Тестовые посты и снятые индексы откатываются после отчета."""
+        out = io.StringIO()
+        call_command(
+            'explain_feeds', posts=20, authors=3, groups=2, stdout=out)
+        self.assertIn('С индексами', out.getvalue())
+        self.assertFalse(Post.objects.exists())
+        self.assertFalse(User.objects.exists())
+        with connection.cursor() as cursor:
+            indexes = connection.introspection.get_constraints(
+                cursor, Post._meta.db_table)
+        self.assertIn('post_pub_date_idx', indexes)
@@ -1,16 +1,32 @@
+import os
 import shutil
 import tempfile
+import time
 from http import HTTPStatus
+from io import BytesIO, StringIO
+from unittest import mock
 
-from django.conf import settings
 from django.core.cache import cache
+from django.core.files.base import ContentFile
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db.models import ImageField
+from django.db.models.fields.files import ImageFieldFile
 from django.test import Client, TestCase, override_settings
 from django.urls import reverse
+from PIL import Image
+from sorl.thumbnail import get_thumbnail
 
+from ..forms import PostForm
+from ..media import release_files
 from ..models import Comment, Group, Post, User
+from ..storage import IDLE_SECONDS, media_storage
+from ..thumbnails import (LEGACY_GEOMETRY, LEGACY_OPTIONS, THUMBNAIL_SIZE,
+                          prefetch_legacy_thumbnails, render_in_background,
+                          render_thumbnail, rendition_formats)
+from ..uploads import MAX_PIXELS, MAX_SIDE, process_upload
 
-TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+TEMP_MEDIA_ROOT = tempfile.mkdtemp()
 small_gif = (
     b'\x47\x49\x46\x38\x39\x61\x02\x00'
     b'\x01\x00\x80\x00\x00\x00\x00\x00'
@@ -80,14 +96,15 @@ class PostFormTests(TestCase):
                 kwargs={'username': self.post_author.username})
         )
         self.assertEqual(Post.objects.count(), posts_count + 1)
-        self.assertTrue(
-            Post.objects.filter(
-                text=form_data['text'],
-                group=form_data['group'],
-                author=self.post_author,
-                image='posts/small.gif',
-            ).exclude(id__in=posts_before_posting).exists()
-        )
+        post = Post.objects.filter(
+            text=form_data['text'],
+            group=form_data['group'],
+            author=self.post_author,
+        ).exclude(id__in=posts_before_posting).get()
+        digest = post.image_hash
+        self.assertEqual(
+            post.image.name,
+            f'posts/{digest[:2]}/{digest[2:4]}/{digest}.gif')
 
     def test_authorized_user_create_comment(self):
         """Проверка создания коментария авторизированным клиентом."""
@@ -163,6 +180,225 @@ class PostFormTests(TestCase):
         self.assertEqual(post_one.group_id, form_data['group'])
         self.assertIsNotNone(post.image.name, 'posts/small.gif')
 
+    def test_image_thumbnail_is_scheduled(self):
+        """Новая картинка ставит миниатюру в очередь."""
+        uploaded = SimpleUploadedFile(
+            name='small.gif',
+            content=small_gif,
+            content_type='image/gif'
+        )
+        with mock.patch('posts.forms.schedule_thumbnail') as schedule:
+            self.authorized_user.post(
+                reverse('posts:post_create'),
+                data={'text': 'С картинкой', 'image': uploaded})
+        post = Post.objects.get(text='С картинкой')
+        schedule.assert_called_once_with(post)
+        response = self.authorized_user.get(
+            reverse('posts:post_detail', kwargs={'post_id': post.id}))
+        self.assertContains(response, 'Картинка обрабатывается')
+
+    def test_render_thumbnail(self):
+        """Миниатюра кадрируется до 960x339."""
+        post = Post.objects.create(
+            text='С картинкой',
+            author=self.post_author,
+            image=SimpleUploadedFile('thumb.gif', small_gif))
+        render_thumbnail(post.pk)
+        post.refresh_from_db()
+        with Image.open(post.thumbnail.path) as thumbnail:
+            self.assertEqual(thumbnail.size, THUMBNAIL_SIZE)
+        response = self.authorized_user.get(
+            reverse('posts:post_detail', kwargs={'post_id': post.id}))
+        self.assertContains(response, post.thumbnail.url)
+        for rendition in post.renditions.all():
+            with self.subTest(format=rendition.format):
+                self.assertEqual(rendition.width, 320)
+                self.assertContains(
+                    response, f'{rendition.image.url} 320w')
+        self.assertEqual(
+            post.renditions.count(), len(rendition_formats()))
+
+    def test_prefetch_legacy_thumbnails(self):
+        """Старые миниатюры sorl находятся без запроса на каждый пост."""
+        posts = [
+            Post.objects.create(
+                text=f'Старый пост {i}',
+                author=self.post_author,
+                image=SimpleUploadedFile(f'legacy{i}.gif', small_gif))
+            for i in range(3)
+        ]
+        # Старый тег {% thumbnail %} видел картинку в default_storage
+        legacy_field = ImageField(upload_to='posts/')
+        thumbnails = [
+            get_thumbnail(
+                ImageFieldFile(post, legacy_field, post.image.name),
+                LEGACY_GEOMETRY, **LEGACY_OPTIONS)
+            for post in posts
+        ]
+        with self.assertNumQueries(0):
+            prefetch_legacy_thumbnails(posts)
+        for post, thumbnail in zip(posts, thumbnails):
+            self.assertEqual(post.legacy_thumbnail.url, thumbnail.url)
+        cache.clear()
+        with self.assertNumQueries(1):
+            prefetch_legacy_thumbnails(posts)
+        self.assertEqual(posts[0].legacy_thumbnail.url, thumbnails[0].url)
+
+    def test_missing_legacy_thumbnail_is_scheduled(self):
+        """Пост без старой миниатюры sorl получает новую в очереди."""
+        post = Post.objects.create(
+            text='Старый пост',
+            author=self.post_author,
+            image=SimpleUploadedFile('legacy.gif', small_gif))
+        with mock.patch(
+                'posts.thumbnails.schedule_thumbnail') as schedule:
+            prefetch_legacy_thumbnails([post])
+        self.assertIsNone(post.legacy_thumbnail)
+        schedule.assert_called_once_with(post)
+
+    def test_failed_thumbnail_is_not_requeued(self):
+        """Пост, миниатюра которого не вышла, страница не ставит снова."""
+        post = Post.objects.create(
+            text='Старый пост',
+            author=self.post_author,
+            image=SimpleUploadedFile('broken.gif', small_gif))
+        with mock.patch('posts.thumbnails.connection'), mock.patch(
+                'posts.thumbnails.render_thumbnail',
+                side_effect=FileNotFoundError):
+            with self.assertLogs('posts.thumbnails', 'ERROR'):
+                render_in_background(post.pk)
+        with mock.patch(
+                'posts.thumbnails.schedule_thumbnail') as schedule:
+            prefetch_legacy_thumbnails([post])
+        schedule.assert_not_called()
+
+    def test_upload_strips_metadata_and_downscales(self):
+        """Большая картинка уменьшается, EXIF не сохраняется."""
+        exif = Image.Exif()
+        exif[0x010F] = 'Phone'
+        buffer = BytesIO()
+        Image.new('RGB', (MAX_SIDE * 2, MAX_SIDE)).save(
+            buffer, 'JPEG', exif=exif)
+        uploaded = SimpleUploadedFile(
+            'photo.jpg', buffer.getvalue(), 'image/jpeg')
+        with mock.patch('posts.forms.schedule_thumbnail'):
+            self.authorized_user.post(
+                reverse('posts:post_create'),
+                data={'text': 'Фото', 'image': uploaded})
+        post = Post.objects.get(text='Фото')
+        with Image.open(post.image.path) as image:
+            self.assertEqual(image.size, (MAX_SIDE, MAX_SIDE // 2))
+            self.assertFalse(image.getexif())
+
+    def test_upload_pixel_limit(self):
+        """Картинка больше лимита пикселей отклоняется."""
+        buffer = BytesIO()
+        Image.new('1', (MAX_PIXELS // 1000 + 1, 1000)).save(buffer, 'PNG')
+        uploaded = SimpleUploadedFile(
+            'huge.png', buffer.getvalue(), 'image/png')
+        form = PostForm(
+            data={'text': 'Большая'}, files={'image': uploaded})
+        self.assertFalse(form.is_valid())
+        self.assertIn('image', form.errors)
+
+    def test_same_upload_is_reused(self):
+        """Одинаковая картинка не сохраняется второй раз."""
+        first = Post.objects.create(
+            text='Первый', author=self.post_author, thumbnail='t.jpg')
+        first.image, first.image_hash = process_upload(
+            SimpleUploadedFile('a.gif', small_gif))
+        first.save()
+        path = first.image.path
+        idle = time.time() - IDLE_SECONDS - 1
+        os.utime(path, (idle, idle))
+        with mock.patch('posts.forms.schedule_thumbnail') as schedule:
+            self.authorized_user.post(
+                reverse('posts:post_create'),
+                data={
+                    'text': 'Второй',
+                    'image': SimpleUploadedFile('b.gif', small_gif),
+                })
+        second = Post.objects.get(text='Второй')
+        schedule.assert_not_called()
+        self.assertEqual(second.image.name, first.image.name)
+        self.assertEqual(second.thumbnail.name, first.thumbnail.name)
+        self.assertGreater(
+            os.path.getmtime(path), idle, 'Повторно взятый файл не тронут')
+
+    def test_cleared_image_drops_renditions(self):
+        """Убранная картинка уходит вместе с миниатюрой и копиями."""
+        post = Post.objects.create(
+            text='С картинкой',
+            author=self.post_author,
+            image=SimpleUploadedFile('clear.gif', small_gif))
+        render_thumbnail(post.pk)
+        self.assertTrue(post.renditions.exists())
+        self.authorized_user.post(
+            reverse('posts:post_edit', args=[post.id]),
+            data={'text': post.text, 'image-clear': 'on'})
+        post.refresh_from_db()
+        self.assertEqual(post.image.name, '')
+        self.assertEqual(post.thumbnail.name, '')
+        self.assertFalse(post.renditions.exists())
+
+    def test_orphan_media_is_removed(self):
+        """Файл удаляется, когда на него не ссылается ни один пост."""
+        first = Post.objects.create(
+            text='Первый',
+            author=self.post_author,
+            image=SimpleUploadedFile('first.gif', small_gif))
+        second = Post.objects.create(
+            text='Второй',
+            author=self.post_author,
+            image=SimpleUploadedFile('second.gif', small_gif))
+        self.assertEqual(first.image.name, second.image.name)
+        path = first.image.path
+        first.delete()
+        release_files([first.image.name])
+        self.assertTrue(os.path.exists(path))
+        second.delete()
+        release_files([second.image.name])
+        self.assertTrue(
+            os.path.exists(path), 'Свежий файл удален до истечения срока')
+        idle = time.time() - IDLE_SECONDS - 1
+        os.utime(path, (idle, idle))
+        release_files([second.image.name])
+        self.assertFalse(os.path.exists(path))
+
+    def test_sweep_media_removes_idle_orphans(self):
+        """Команда убирает давние файлы без ссылок, остальные оставляет."""
+        post = Post.objects.create(
+            text='Пост',
+            author=self.post_author,
+            image=SimpleUploadedFile('kept.gif', small_gif))
+        orphan = media_storage.save(
+            'posts/orphan.png', ContentFile(b'orphan'))
+        fresh = media_storage.save('posts/fresh.png', ContentFile(b'fresh'))
+        idle = time.time() - IDLE_SECONDS - 1
+        for name in (post.image.name, orphan):
+            os.utime(media_storage.path(name), (idle, idle))
+        out = StringIO()
+        call_command('sweep_media', stdout=out)
+        self.assertIn('Удалено файлов:', out.getvalue())
+        self.assertFalse(media_storage.exists(orphan))
+        self.assertTrue(media_storage.exists(fresh))
+        self.assertTrue(media_storage.exists(post.image.name))
+
+    def test_reused_media_is_not_removed(self):
+        """Повторная загрузка того же файла продлевает ему жизнь."""
+        post = Post.objects.create(
+            text='Пост',
+            author=self.post_author,
+            image=SimpleUploadedFile('first.gif', small_gif))
+        path = post.image.path
+        post.delete()
+        idle = time.time() - IDLE_SECONDS - 1
+        os.utime(path, (idle, idle))
+        media_storage.save('posts/again.gif', SimpleUploadedFile(
+            'again.gif', small_gif))
+        release_files([post.image.name])
+        self.assertTrue(os.path.exists(path))
+
     def test_nonauthorized_user_create_post(self):
         """Проверка создания записи не авторизированным пользователем."""
         posts_count = Post.objects.count()
@@ -1,6 +1,11 @@
+import io
+
+from django.core.management import call_command
+from django.db import IntegrityError
 from django.test import TestCase
 
-from ..models import POST_COUNT, Group, Post, User
+from ..forms import PostForm
+from ..models import POST_COUNT, Comment, Follow, Group, Post, User, UserStats
 
 
 class PostModelTest(TestCase):
@@ -47,3 +52,76 @@ class PostModelTest(TestCase):
     def test_group_str(self):
         """Проверка __str__ у group."""
         self.assertEqual(self.group.title, str(self.group))
+
+    def test_follow_unique(self):
+        """Подписаться на автора дважды нельзя."""
+        follower = User.objects.create_user(username='follower')
+        Follow.objects.create(user=follower, author=self.user)
+        with self.assertRaises(IntegrityError):
+            Follow.objects.create(user=follower, author=self.user)
+
+
+class CountersTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+
+    def stats(self, user):
+        return UserStats.objects.get(user=user)
+
+    def test_counters_follow_changes(self):
+        """Счетчики сдвигаются при создании и удалении записей."""
+        post = Post.objects.create(author=self.author, text='Пост')
+        comment = Comment.objects.create(
+            post=post, author=self.reader, text='Комментарий')
+        follow = Follow.objects.create(user=self.reader, author=self.author)
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 1)
+        self.assertEqual(self.stats(self.author).posts_count, 1)
+        self.assertEqual(self.stats(self.author).followers_count, 1)
+        self.assertEqual(self.stats(self.reader).following_count, 1)
+        comment.delete()
+        follow.delete()
+        post.delete()
+        stats = self.stats(self.author)
+        self.assertEqual(
+            (stats.posts_count, stats.followers_count), (0, 0))
+        self.assertEqual(self.stats(self.reader).following_count, 0)
+
+    def test_reconcile_repairs_drift(self):
+        """reconcile_counters чинит счетчики, разошедшиеся с данными."""
+        post = Post.objects.create(author=self.author, text='Пост')
+        Comment.objects.bulk_create([
+            Comment(post=post, author=self.reader, text='Комментарий')
+            for _ in range(3)
+        ])
+        UserStats.objects.filter(user=self.author).update(posts_count=7)
+        UserStats.objects.filter(user=self.reader).delete()
+        out = io.StringIO()
+        call_command('reconcile_counters', stdout=out)
+        self.assertIn('пользователей 1, постов 1', out.getvalue())
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 3)
+        self.assertEqual(self.stats(self.author).posts_count, 1)
+        self.assertEqual(self.stats(self.reader).posts_count, 0)
+
+    def test_reconcile_creates_many_stats(self):
+        """Записи счетчиков создаются для пользователей сверх одной пачки."""
+        User.objects.bulk_create(
+            [User(username=f'user_{i}') for i in range(600)])
+        call_command('reconcile_counters', stdout=io.StringIO())
+        self.assertEqual(UserStats.objects.count(), User.objects.count())
+
+    def test_stale_post_save_keeps_comments_count(self):
+        """Правка устаревшего экземпляра не затирает число комментариев."""
+        post = Post.objects.create(author=self.author, text='Пост')
+        Comment.objects.create(
+            post=post, author=self.reader, text='Комментарий')
+        form = PostForm(data={'text': 'Исправленный пост'}, instance=post)
+        self.assertTrue(form.is_valid())
+        form.save()
+        post.refresh_from_db()
+        self.assertEqual(post.text, 'Исправленный пост')
+        self.assertEqual(post.comments_count, 1)
@@ -1,10 +1,22 @@
-from django.core.cache import cache
+import os
+import tempfile
+import time
+from unittest import mock
+
+from django.core.cache import cache, caches
 from django.core.paginator import Page
-from django.test import Client, TestCase
+from django.db import connection
+from django.http import HttpResponse
+from django.test import Client, RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
-from ..models import Follow, Group, Post, User
-from ..utils import POST_NUMBER
+from ..feeds import trim_feeds
+from ..fragments import (LOCAL_TIMEOUT, LOCK_TIMEOUT, acquire_lock,
+                         get_or_build, lock_path, release_lock, version_key)
+from ..models import Comment, FeedEntry, Follow, Group, Post, User
+from ..pages import cached_page, page_key
+from ..utils import COMMENT_NUMBER, POST_NUMBER, CountedPaginator, get_count
 
 POST_SUM_FOR_PAGINATOR = 13
 page_number_two = 3
@@ -103,6 +115,52 @@ class TestContextPages(TestCase):
                 kwargs={'post_id': self.post.id}))
         self.check_post_info(response.context['post'])
 
+    def test_detail_page_queries_do_not_grow(self):
+        """Число запросов post_detail не зависит от числа комментариев."""
+        url = reverse('posts:post_detail', kwargs={'post_id': self.post.id})
+        Comment.objects.create(
+            post=self.post, author=self.user, text='комментарий')
+        with CaptureQueriesContext(connection) as one_comment:
+            self.authorized_client.get(url)
+        for _ in range(20):
+            Comment.objects.create(
+                post=self.post, author=self.user_2, text='комментарий')
+        with CaptureQueriesContext(connection) as many_comments:
+            response = self.authorized_client.get(url)
+        self.assertEqual(len(many_comments), len(one_comment))
+        self.assertEqual(response.context['comments_count'], 21)
+        self.assertEqual(
+            response.context['post'].author.stats.posts_count, 1)
+
+    def test_detail_page_comments_are_paginated(self):
+        """На странице поста первая порция комментариев, дальше по курсору."""
+        Comment.objects.bulk_create([
+            Comment(post=self.post, author=self.user, text=f'комментарий {i}')
+            for i in range(COMMENT_NUMBER + 5)
+        ])
+        response = self.authorized_client.get(reverse(
+            'posts:post_detail', kwargs={'post_id': self.post.id}))
+        first = response.context['comments']
+        self.assertEqual(len(first), COMMENT_NUMBER)
+        cursor = first.paginator.next_cursor
+        self.assertContains(response, f'?after={cursor}')
+
+        url = reverse('posts:post_comments', kwargs={'post_id': self.post.id})
+        response = self.client.get(url, {'after': cursor})
+        self.assertTemplateUsed(response, 'posts/includes/comment_list.html')
+        self.assertEqual(len(response.context['comments']), 5)
+        self.assertNotContains(response, 'Показать еще')
+
+        data = self.client.get(
+            url, {'after': cursor, 'format': 'json'}).json()
+        self.assertIsNone(data['next'])
+        self.assertEqual(
+            [comment['id'] for comment in data['comments']],
+            [comment.pk for comment in response.context['comments']])
+        self.assertFalse(
+            {comment['id'] for comment in data['comments']}
+            & {comment.pk for comment in first})
+
     def test_profile_page_show_correct_context(self):
         """Шаблон profile.html сформирован с правильным контекстом."""
         response = TestContextPages.client.get(
@@ -126,6 +184,74 @@ class TestContextPages(TestCase):
             response.context['page_obj'].object_list[0], new_post,
             'Новый пост не выводится первым')
 
+    def test_index_fragment_is_invalidated(self):
+        """Фрагмент главной кешируется и сбрасывается при новом посте."""
+        url = reverse('posts:index')
+        self.client_auth.get(url)
+        Post.objects.filter(pk=self.post.pk).update(text='без сигнала')
+        response = self.client_auth.get(url)
+        self.assertNotContains(response, 'без сигнала')
+        Post.objects.create(text='новый пост', author=self.user)
+        response = self.client_auth.get(url)
+        self.assertContains(response, 'новый пост')
+        self.assertContains(response, 'без сигнала')
+
+    def test_stale_fragment_served_while_rebuilding(self):
+        """Пока фрагмент пересобирает другой процесс, отдается старая
+        копия."""
+        build = mock.Mock(return_value='новый')
+        self.assertEqual(get_or_build('fragment', 1, lambda: 'старый'),
+                         'старый')
+        cache.add('fragment:lock', 1)
+        self.assertEqual(get_or_build('fragment', 2, build), 'старый')
+        build.assert_not_called()
+        cache.delete('fragment:lock')
+        self.assertEqual(get_or_build('fragment', 2, build), 'новый')
+        self.assertEqual(get_or_build('fragment', 2, build), 'новый')
+        build.assert_called_once()
+
+    @override_settings(CACHES={'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': tempfile.mkdtemp(),
+    }})
+    def test_shared_cache_backend(self):
+        """Фрагменты работают с общим файловым кешем."""
+        url = reverse('posts:index')
+        self.client_auth.get(url)
+        Post.objects.create(text='новый пост', author=self.user)
+        self.assertContains(self.client_auth.get(url), 'новый пост')
+        get_or_build('fragment', 1, lambda: 'значение')
+        _, refresh_at, _ = cache.get('fragment')
+        self.assertGreater(refresh_at - time.time(), LOCAL_TIMEOUT)
+
+    @override_settings(CACHES={'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': tempfile.mkdtemp(),
+    }})
+    def test_file_cache_lock_is_exclusive(self):
+        """В файловом кеше блокировку держит только один процесс."""
+        self.assertTrue(acquire_lock('fragment:lock'))
+        self.assertFalse(acquire_lock('fragment:lock'))
+        release_lock('fragment:lock')
+        self.assertTrue(acquire_lock('fragment:lock'))
+        path = lock_path(caches['default'], 'fragment:lock')
+        abandoned = time.time() - LOCK_TIMEOUT - 1
+        os.utime(path, (abandoned, abandoned))
+        self.assertTrue(acquire_lock('fragment:lock'))
+        release_lock('fragment:lock')
+
+    def test_local_cache_keeps_short_timeout(self):
+        """В локальном кеше фрагменты и версии живут LOCAL_TIMEOUT."""
+        get_or_build('fragment', 1, lambda: 'значение')
+        _, refresh_at, _ = cache.get('fragment')
+        self.assertLessEqual(refresh_at - time.time(), LOCAL_TIMEOUT)
+        self.client.get(reverse('posts:index'))
+        self.assertIsNotNone(cache.get(version_key('index')))
+        later = time.time() + LOCAL_TIMEOUT + 1
+        with mock.patch('django.core.cache.backends.locmem.time.time',
+                        return_value=later):
+            self.assertIsNone(cache.get(version_key('index')))
+
     def test_post_added_correctly_user2(self):
         """После публикации, пост не попадает в чужую группу."""
         group2 = Group.objects.create(title='Тестовая группа 2',
@@ -214,6 +340,69 @@ class TestPaginatorPages(TestCase):
 
                 self.assertEqual(context_for_second, post_for_second)
 
+    def test_cursor_pages(self):
+        """Курсор `after`/`before` листает страницы без номера."""
+        url = reverse('posts:index')
+        first_page = self.auth_author.get(url).context['page_obj']
+        next_cursor = first_page.paginator.next_cursor
+        self.assertIsNotNone(next_cursor)
+        self.assertIsNone(first_page.paginator.previous_cursor)
+
+        second_page = self.auth_author.get(
+            url, {'after': next_cursor}).context['page_obj']
+        self.assertEqual(
+            len(second_page), len(self.post) - POST_NUMBER)
+        self.assertIsNone(second_page.paginator.next_cursor)
+        self.assertFalse(
+            set(first_page.object_list) & set(second_page.object_list))
+
+        back_page = self.auth_author.get(
+            url,
+            {'before': second_page.paginator.previous_cursor}
+        ).context['page_obj']
+        self.assertEqual(
+            list(back_page.object_list), list(first_page.object_list))
+
+    def test_page_count_is_cached(self):
+        """Число постов берется из счетчика, а не из COUNT(*)."""
+        url = reverse('posts:index')
+        self.auth_author.get(url, {'page': 1})
+        post = Post.objects.create(author=self.author, text='новый')
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                get_count('index', Post.objects.all()), len(self.post) + 1)
+        post.delete()
+        response = self.auth_author.get(url, {'page': 1})
+        self.assertEqual(
+            response.context['page_obj'].paginator.count, len(self.post))
+
+    @override_settings(CACHES={'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': tempfile.mkdtemp(),
+    }})
+    def test_page_count_without_atomic_incr(self):
+        """Без атомарного incr число постов каждый раз считает COUNT(*)."""
+        get_count('index', Post.objects.all())
+        Post.objects.create(author=self.author, text='новый')
+        with self.assertNumQueries(1):
+            self.assertEqual(
+                get_count('index', Post.objects.all()), len(self.post) + 1)
+
+    def test_page_links_are_bounded(self):
+        """Ссылок на страницы выводится ограниченное число."""
+        paginator = CountedPaginator(range(1000), POST_NUMBER)
+        page_range = list(paginator.get_elided_page_range(50))
+        self.assertEqual(
+            page_range,
+            [1, paginator.ELLIPSIS, 48, 49, 50, 51, 52,
+             paginator.ELLIPSIS, 100])
+
+    def test_broken_cursor_returns_first_page(self):
+        """Битый курсор открывает первую страницу."""
+        response = self.auth_author.get(
+            reverse('posts:index'), {'after': '!!!'})
+        self.assertEqual(len(response.context['page_obj']), POST_NUMBER)
+
 
 class FollowViewsTest(TestCase):
     @classmethod
@@ -298,3 +487,308 @@ class FollowViewsTest(TestCase):
         response = self.author_client.get(
             reverse('posts:follow_index'))
         self.assertNotIn(post, response.context['page_obj'].object_list)
+
+    def test_follow_feed_is_materialized(self):
+        """Посты автора раскладываются по лентам подписчиков."""
+        Follow.objects.create(
+            user=self.post_follower,
+            author=self.post_author)
+        self.assertTrue(FeedEntry.objects.filter(
+            user=self.post_follower, post=self.post).exists())
+        post = Post.objects.create(
+            author=self.post_author,
+            text=self.text)
+        self.assertTrue(FeedEntry.objects.filter(
+            user=self.post_follower, post=post).exists())
+        Follow.objects.filter(
+            user=self.post_follower,
+            author=self.post_author).delete()
+        self.assertFalse(
+            FeedEntry.objects.filter(user=self.post_follower).exists())
+
+    def test_follow_feed_is_bounded(self):
+        """Лента подписок хранит ограниченное число постов."""
+        Follow.objects.create(
+            user=self.post_follower,
+            author=self.post_author)
+        with mock.patch('posts.feeds.FEED_LENGTH', 2):
+            for _ in range(3):
+                Post.objects.create(
+                    author=self.post_author,
+                    text=self.text)
+        self.assertEqual(
+            FeedEntry.objects.filter(user=self.post_follower).count(), 2)
+
+    def test_trim_keeps_feed_length_on_equal_dates(self):
+        """Обрезка по (pub_date, post_id) не режет ленту ниже предела."""
+        Post.objects.bulk_create([
+            Post(author=self.post_author, text=f'Пост {i}')
+            for i in range(4)
+        ])
+        Post.objects.update(pub_date=self.post.pub_date)
+        FeedEntry.objects.bulk_create([
+            FeedEntry(user=self.post_follower, post=post,
+                      pub_date=post.pub_date)
+            for post in Post.objects.all()
+        ])
+        with mock.patch('posts.feeds.FEED_LENGTH', 2):
+            with self.assertNumQueries(1):
+                trim_feeds([self.post_follower.pk, self.post_author.pk])
+        self.assertEqual(
+            list(FeedEntry.objects.values_list('post_id', flat=True)
+                 .order_by('post_id')),
+            list(Post.objects.order_by('pk').values_list(
+                'pk', flat=True))[-2:])
+
+    def test_follow_feed_pages_over_feed_entries(self):
+        """Лента листается по записям ленты, без соединения с постами."""
+        Post.objects.bulk_create([
+            Post(author=self.post_author, text=f'Пост {i}')
+            for i in range(POST_NUMBER + 2)
+        ])
+        # Одинаковые даты: порядок держится на post_id
+        Post.objects.update(pub_date=self.post.pub_date)
+        Follow.objects.create(user=self.post_follower, author=self.post_author)
+        url = reverse('posts:follow_index')
+        with CaptureQueriesContext(connection) as queries:
+            first = self.author_client.get(url).context['page_obj']
+        feed_queries = [
+            query['sql'] for query in queries.captured_queries
+            if 'posts_feedentry' in query['sql']]
+        self.assertEqual(len(feed_queries), 1)
+        self.assertNotIn('posts_post', feed_queries[0])
+        second = self.author_client.get(
+            url, {'after': first.paginator.next_cursor}).context['page_obj']
+        seen = [post.pk for post in first] + [post.pk for post in second]
+        self.assertEqual(
+            seen, list(Post.objects.order_by('-pk').values_list(
+                'pk', flat=True)))
+
+    def test_profile_checks_follow_in_author_query(self):
+        """Подписка на автора не требует отдельного запроса."""
+        Follow.objects.create(
+            user=self.post_follower,
+            author=self.post_author)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.author_client.get(reverse(
+                'posts:profile', args=[self.post_author.username]))
+        self.assertTrue(response.context['following'])
+        follow_checks = [
+            query['sql'] for query in queries.captured_queries
+            if query['sql'].startswith('SELECT (1) AS "a" FROM "posts_')]
+        self.assertEqual(follow_checks, [])
+
+    def test_profile_loads_only_page_posts(self):
+        """Профиль выбирает посты автора только для текущей страницы."""
+        Post.objects.bulk_create([
+            Post(author=self.post_author, text=f'Пост {i}')
+            for i in range(POST_NUMBER * 3)
+        ])
+        with CaptureQueriesContext(connection) as queries:
+            self.author_client.get(reverse(
+                'posts:profile', args=[self.post_author.username]))
+        post_queries = [
+            query['sql'] for query in queries.captured_queries
+            if 'FROM "posts_post"' in query['sql']]
+        self.assertTrue(post_queries)
+        for sql in post_queries:
+            self.assertIn('LIMIT', sql)
+
+
+class SearchViewsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='reader')
+        cls.books = Post.objects.create(
+            author=cls.user,
+            text='Старые книги пахнут пылью')
+        cls.river = Post.objects.create(
+            author=cls.user,
+            text='Прогулка вдоль реки')
+        Comment.objects.create(
+            post=cls.river,
+            author=cls.user,
+            text='Летом тут отличная рыбалка')
+
+    def search(self, query):
+        response = self.client.get(reverse('posts:search'), {'q': query})
+        return response.context['posts']
+
+    def test_search_matches_word_forms(self):
+        """Поиск находит пост по другой форме слова."""
+        self.assertEqual(self.search('книгами'), [self.books])
+
+    def test_search_matches_comments(self):
+        """Поиск учитывает текст комментариев."""
+        self.assertEqual(self.search('рыбалку'), [self.river])
+
+    def test_search_follows_edits_and_deletes(self):
+        """Индекс обновляется при правке и удалении поста."""
+        post = Post.objects.get(pk=self.books.pk)
+        post.text = 'Новые журналы'
+        post.save()
+        self.assertEqual(self.search('книга'), [])
+        self.assertEqual(self.search('журнал'), [post])
+        post.delete()
+        self.assertEqual(self.search('журнал'), [])
+
+    def test_admin_search_uses_index(self):
+        """Поиск в админке идет по полнотекстовому индексу."""
+        admin = User.objects.create_superuser(
+            username='admin', email='admin@example.com', password='pass')
+        self.client.force_login(admin)
+        response = self.client.get(
+            reverse('admin:posts_post_changelist'), {'q': 'реками'})
+        self.assertEqual(
+            list(response.context['cl'].result_list), [self.river])
+
+
+class ConditionalPagesTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.group = Group.objects.create(title='Группа', slug='group')
+        cls.post = Post.objects.create(
+            author=cls.author, group=cls.group, text='Пост')
+
+    def setUp(self):
+        cache.clear()
+        self.urls = [
+            reverse('posts:index'),
+            reverse('posts:group_list', args=[self.group.slug]),
+            reverse('posts:profile', args=[self.author.username]),
+            reverse('posts:post_detail', args=[self.post.pk]),
+        ]
+
+    def test_anonymous_pages_are_cacheable(self):
+        """Анонимные страницы отдаются с валидаторами и кешируются прокси."""
+        for url in self.urls:
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertIn('public', response['Cache-Control'])
+                self.assertIn('s-maxage', response['Cache-Control'])
+                self.assertIn('Cookie', response['Vary'])
+                self.assertNotIn('Last-Modified', response)
+                response = self.client.get(
+                    url, HTTP_IF_NONE_MATCH=response['ETag'])
+                self.assertEqual(response.status_code, 304)
+
+    def test_not_modified_skips_view(self):
+        """304 для главной не выбирает посты и не рисует шаблон."""
+        url = reverse('posts:index')
+        etag = self.client.get(url)['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertFalse(response.templates)
+
+    def test_changes_invalidate_etag(self):
+        """Новый пост и комментарий меняют ETag затронутых страниц."""
+        etags = {url: self.client.get(url)['ETag'] for url in self.urls}
+        Post.objects.create(author=self.author, group=self.group, text='Еще')
+        Comment.objects.create(
+            post=self.post, author=self.author, text='Комментарий')
+        for url, etag in etags.items():
+            with self.subTest(url=url):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 200)
+
+    def test_author_rename_invalidates_etag(self):
+        """Новое имя автора меняет ETag, вход пользователя - нет."""
+        etags = {url: self.client.get(url)['ETag'] for url in self.urls}
+        self.author.last_login = self.author.date_joined
+        self.author.save(update_fields=['last_login'])
+        for url, etag in etags.items():
+            with self.subTest(url=url):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 304)
+        self.author.first_name = 'Лев'
+        self.author.save()
+        for url, etag in etags.items():
+            with self.subTest(url=url):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 200)
+
+    def test_logged_in_pages_are_private(self):
+        """Страницы вошедшего пользователя прокси не хранит."""
+        client = Client()
+        client.force_login(self.author)
+        for url in self.urls:
+            with self.subTest(url=url):
+                response = client.get(url)
+                self.assertIn('private', response['Cache-Control'])
+                self.assertNotIn('public', response['Cache-Control'])
+
+
+class CachedPageTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(title='Группа', slug='group')
+        cls.post = Post.objects.create(
+            author=cls.author, group=cls.group, text='Общий пост')
+
+    def setUp(self):
+        cache.clear()
+        self.reader_client = Client()
+        self.reader_client.force_login(self.reader)
+
+    def test_logged_in_users_reuse_anonymous_body(self):
+        """Вошедший получает тело из кеша анонима со своей шапкой."""
+        for url in (
+            reverse('posts:index'),
+            reverse('posts:group_list', args=[self.group.slug]),
+        ):
+            with self.subTest(url=url):
+                anonymous = self.client.get(url)
+                self.assertContains(anonymous, 'Общий пост')
+                self.assertContains(anonymous, 'Войти')
+                self.assertNotContains(anonymous, '<!--hole:')
+                response = self.reader_client.get(url)
+                self.assertNotIn('page_obj', response.context)
+                self.assertContains(response, 'Общий пост')
+                self.assertContains(response, 'Пользователь: reader')
+                self.assertContains(response, 'Избранные авторы')
+                self.assertNotContains(response, 'Войти')
+
+    def test_cached_body_follows_versions(self):
+        """Новый пост попадает в закешированную страницу сразу."""
+        url = reverse('posts:index')
+        self.client.get(url)
+        Post.objects.create(author=self.author, text='Свежий пост')
+        self.assertContains(self.reader_client.get(url), 'Свежий пост')
+
+    def test_cached_response_keeps_headers(self):
+        """Копия из кеша сохраняет статус и заголовки ответа view."""
+        view = mock.Mock(return_value=HttpResponse(
+            'тело', status=203, content_type='text/plain; charset=utf-8'))
+        view.return_value['X-Source'] = 'view'
+        cached_view = cached_page(lambda request: ['index'])(view)
+        for _ in range(2):
+            response = cached_view(RequestFactory().get('/'))
+            self.assertEqual(response.status_code, 203)
+            self.assertEqual(
+                response['Content-Type'], 'text/plain; charset=utf-8')
+            self.assertEqual(response['X-Source'], 'view')
+            self.assertEqual(response.content.decode(), 'тело')
+        view.assert_called_once()
+
+    def test_page_key_ignores_foreign_params(self):
+        """Ключ тела - хеш пути и параметров страницы."""
+        url = reverse('posts:index')
+        factory = RequestFactory()
+        key = page_key(factory.get(url, {'page': 2, 'utm': 'x' * 300}))
+        self.assertEqual(key, page_key(factory.get(url, {'page': 2})))
+        self.assertNotEqual(key, page_key(factory.get(url, {'page': 3})))
+        self.assertLess(len(key), 250)
+
+    def test_holes_render_inline_outside_page_cache(self):
+        """На некешируемых страницах шапка рисуется на месте."""
+        response = self.reader_client.get(
+            reverse('posts:profile', args=[self.author.username]))
+        self.assertContains(response, 'Пользователь: reader')
+        self.assertNotContains(response, '<!--hole:')
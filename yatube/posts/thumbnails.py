@@ -0,0 +1,202 @@
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor, wait
+from io import BytesIO
+
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from PIL import Image, ImageOps
+from sorl.thumbnail import default
+from sorl.thumbnail.conf import defaults as sorl_defaults
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.images import ImageFile, deserialize_image_file
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.kvstores.cached_db_kvstore import EMPTY_VALUE
+from sorl.thumbnail.models import KVStore
+
+from .models import Post, PostRendition
+
+THUMBNAIL_SIZE = (960, 339)
+THUMBNAIL_QUALITY = 85
+RENDITION_WIDTHS = (320, 640, 960, 1920)
+RENDITION_FORMATS = ('AVIF', 'WEBP')
+# Параметры, с которыми шаблоны раньше вызывали {% thumbnail %}.
+LEGACY_GEOMETRY = '960x339'
+LEGACY_OPTIONS = {'crop': 'center', 'upscale': True}
+
+logger = logging.getLogger(__name__)
+executor = ThreadPoolExecutor(max_workers=2)
+pending = set()
+# Посты, миниатюра которых уже в очереди: страница не ставит их повторно
+queued_posts = set()
+# Сколько страницы не ставят в очередь пост, миниатюра которого не вышла
+FAILED_TIMEOUT = 60 * 60 * 24
+
+
+def rendition_formats():
+    """Форматы копий, которые умеет сохранять установленный Pillow."""
+    Image.init()
+    return [name for name in RENDITION_FORMATS if name in Image.SAVE]
+
+
+def make_thumbnail(image, size=THUMBNAIL_SIZE, format='JPEG'):
+    """Кадрирует картинку по центру до нужного размера, увеличивая мелкие."""
+    image = ImageOps.fit(image, size, Image.LANCZOS)
+    buffer = BytesIO()
+    image.save(buffer, format, quality=THUMBNAIL_QUALITY, optimize=True)
+    return ContentFile(buffer.getvalue())
+
+
+def render_renditions(post, image, name):
+    """Пересоздает копии картинки поста для srcset.
+
+    Ширины больше исходной пропускаются, самая узкая делается всегда.
+    """
+    ratio = THUMBNAIL_SIZE[1] / THUMBNAIL_SIZE[0]
+    renditions = []
+    for width in RENDITION_WIDTHS:
+        if width > image.width and width != RENDITION_WIDTHS[0]:
+            break
+        size = (width, round(width * ratio))
+        for format in rendition_formats():
+            rendition = PostRendition(post=post, width=width, format=format)
+            rendition.image.save(
+                f'{name}-{width}.{format.lower()}',
+                make_thumbnail(image, size, format),
+                save=False)
+            renditions.append(rendition)
+    post.renditions.all().delete()
+    PostRendition.objects.bulk_create(renditions)
+
+
+def render_thumbnail(post_id):
+    """Сохраняет миниатюру картинки поста и ее копии разной ширины."""
+    post = Post.objects.filter(pk=post_id).first()
+    if post is None or not post.image:
+        return
+    with post.image.open('rb') as image_file:
+        with Image.open(image_file) as image:
+            image = image.convert('RGB')
+    name = os.path.splitext(os.path.basename(post.image.name))[0]
+    render_renditions(post, image, name)
+    post.thumbnail.save(f'{name}.jpg', make_thumbnail(image), save=False)
+    post.save(update_fields=['thumbnail'])
+
+
+def failed_key(post_id):
+    return f'posts:thumbnail_failed:{post_id}'
+
+
+def render_in_background(post_id):
+    try:
+        render_thumbnail(post_id)
+    except Exception:
+        logger.exception('Не удалось сделать миниатюру поста %s', post_id)
+        cache.set(failed_key(post_id), True, FAILED_TIMEOUT)
+    finally:
+        queued_posts.discard(post_id)
+        connection.close()
+
+
+def submit_thumbnail(post_id):
+    queued_posts.add(post_id)
+    future = executor.submit(render_in_background, post_id)
+    pending.add(future)
+    future.add_done_callback(pending.discard)
+
+
+def schedule_thumbnail(post):
+    """Ставит миниатюру в очередь фоновых задач после коммита."""
+    transaction.on_commit(lambda: submit_thumbnail(post.pk))
+
+
+def wait_for_thumbnails(timeout=None):
+    """Дожидается поставленных в очередь миниатюр.
+
+    Нужно там, где MEDIA_ROOT вот-вот исчезнет, например в конце теста.
+    """
+    wait(list(pending), timeout)
+
+
+def legacy_thumbnail_key(image):
+    """Ключ sorl-thumbnail для миниатюры, сделанной тегом {% thumbnail %}.
+
+    Повторяет вычисление имени из ThumbnailBackend.get_thumbnail, но без
+    обращения к хранилищу ключей. Ключ sorl включает класс хранилища, а
+    старые миниатюры делались, когда картинки лежали в default_storage.
+    """
+    backend = default.backend
+    source = ImageFile(image.name, default_storage)
+    options = dict(LEGACY_OPTIONS)
+    if sorl_settings.THUMBNAIL_PRESERVE_FORMAT:
+        options.setdefault('format', backend._get_format(source))
+    for key, value in backend.default_options.items():
+        options.setdefault(key, value)
+    for key, attr in backend.extra_options:
+        value = getattr(sorl_settings, attr)
+        if value != getattr(sorl_defaults, attr):
+            options.setdefault(key, value)
+    name = backend._get_thumbnail_filename(source, LEGACY_GEOMETRY, options)
+    return add_prefix(ImageFile(name, default.storage).key)
+
+
+def prefetch_legacy_thumbnails(posts):
+    """Находит старые миниатюры sorl для всей страницы одним чтением.
+
+    Посты без сохраненной миниатюры получают атрибут legacy_thumbnail:
+    уже сделанную sorl-thumbnail картинку или None. Ключи читаются одним
+    get_many из кеша и одним запросом к таблице sorl для промахов.
+
+    Побочный эффект: для поста без старой миниатюры в очередь ставится
+    новая, иначе он так и остался бы с заглушкой. Отрисовка страницы тем
+    самым запускает фоновую запись файлов и строки поста. Пост, миниатюра
+    которого не вышла, FAILED_TIMEOUT секунд в очередь не ставится,
+    чтобы каждый просмотр не повторял ту же ошибку.
+    """
+    pending = {}
+    for post in posts:
+        post.legacy_thumbnail = None
+        if post.image and not post.thumbnail:
+            pending.setdefault(
+                legacy_thumbnail_key(post.image), []).append(post)
+    if not pending:
+        return
+    values = default.kvstore.cache.get_many(list(pending))
+    missing = [key for key in pending if key not in values]
+    if missing:
+        values.update(KVStore.objects.filter(
+            key__in=missing).values_list('key', 'value'))
+    missing = []
+    for key, key_posts in pending.items():
+        value = values.get(key, EMPTY_VALUE)
+        if value == EMPTY_VALUE:
+            missing.extend(
+                post for post in key_posts if post.pk not in queued_posts)
+            continue
+        thumbnail = deserialize_image_file(value)
+        for post in key_posts:
+            post.legacy_thumbnail = thumbnail
+    schedule_missing(missing)
+
+
+def schedule_missing(posts):
+    """Ставит в очередь миниатюры постов, кроме недавно не удавшихся."""
+    if not posts:
+        return
+    failed = cache.get_many([failed_key(post.pk) for post in posts])
+    for post in posts:
+        if failed_key(post.pk) not in failed:
+            schedule_thumbnail(post)
+
+
+def prefetch_renditions(posts):
+    """Загружает копии картинок всех постов страницы одним запросом."""
+    posts = {post.pk: post for post in posts if post.thumbnail}
+    for post in posts.values():
+        post.rendition_list = []
+    if not posts:
+        return
+    for rendition in PostRendition.objects.filter(post_id__in=posts):
+        posts[rendition.post_id].rendition_list.append(rendition)
@@ -0,0 +1,65 @@
+import hashlib
+from io import BytesIO
+
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from PIL import Image, ImageOps
+
+MAX_UPLOAD_SIZE = 10 * 1024 * 1024
+MAX_PIXELS = 24000000
+MAX_SIDE = 2560
+JPEG_QUALITY = 90
+SAVE_OPTIONS = {
+    'JPEG': {'quality': JPEG_QUALITY, 'optimize': True},
+    'PNG': {'optimize': True},
+    'WEBP': {'quality': JPEG_QUALITY},
+}
+
+
+def check_limits(uploaded):
+    """Проверяет размер файла и число пикселей по заголовку картинки."""
+    if uploaded.size > MAX_UPLOAD_SIZE:
+        raise ValidationError(
+            f'Файл больше {MAX_UPLOAD_SIZE // (1024 * 1024)} МБ.')
+    uploaded.seek(0)
+    with Image.open(uploaded) as image:
+        width, height = image.size
+    if width * height > MAX_PIXELS:
+        raise ValidationError(
+            f'Картинка больше {MAX_PIXELS // 1000000} мегапикселей.')
+
+
+def normalize_image(uploaded):
+    """Пересохраняет картинку без метаданных и уменьшает слишком большую.
+
+    JPEG декодируется сразу в уменьшенном масштабе через draft(), поэтому
+    снимок с телефона не разворачивается в памяти целиком. Анимированные
+    картинки возвращаются как есть.
+    """
+    uploaded.seek(0)
+    with Image.open(uploaded) as image:
+        format = image.format
+        if getattr(image, 'is_animated', False):
+            uploaded.seek(0)
+            return uploaded.read()
+        image.draft(image.mode, (MAX_SIDE, MAX_SIDE))
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((MAX_SIDE, MAX_SIDE), Image.LANCZOS)
+        if format == 'JPEG' and image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+        buffer = BytesIO()
+        image.save(buffer, format, **SAVE_OPTIONS.get(format, {}))
+    return buffer.getvalue()
+
+
+def process_upload(uploaded):
+    """Готовит загруженную картинку к сохранению.
+
+    Возвращает новый файл с тем же именем и sha256 его содержимого для
+    поиска одинаковых загрузок.
+    """
+    check_limits(uploaded)
+    content = normalize_image(uploaded)
+    processed = SimpleUploadedFile(
+        uploaded.name, content, uploaded.content_type)
+    return processed, hashlib.sha256(content).hexdigest()
@@ -1,11 +1,208 @@
-from django.core.paginator import Paginator
+import base64
+import binascii
+
+from django.core.cache import cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.cache.backends.memcached import BaseMemcachedCache
+from django.core.paginator import Page, Paginator
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
+
+from core.metrics import count_cache
 
 POST_NUMBER = 10
+COMMENT_NUMBER = 20
+PAGE_LINKS_ON_EACH_SIDE = 2
+# Шаг счетчика, пришедший между COUNT(*) и add, теряется; пересчет
+# раз в COUNT_TIMEOUT ограничивает время, пока число неточно.
+COUNT_TIMEOUT = 60 * 5
+# Бэкенды с атомарным incr. В файловом и табличном кеше incr - это
+# чтение и запись, одновременные шаги в них теряются.
+ATOMIC_COUNTER_BACKENDS = (BaseMemcachedCache, LocMemCache)
+
+
+def counters_enabled():
+    return isinstance(caches['default'], ATOMIC_COUNTER_BACKENDS)
+
+
+def count_key(scope):
+    return f'posts:count:{scope}'
+
+
+def get_count(scope, queryset):
+    """Число записей в разделе: из кеша или одним COUNT(*) с запоминанием.
+
+    Без атомарного incr счетчики не хранятся, и каждый раз идет COUNT(*).
+    """
+    if not counters_enabled():
+        return queryset.count()
+    key = count_key(scope)
+    count = cache.get(key)
+    count_cache(hit=count is not None)
+    if count is None:
+        count = queryset.count()
+        cache.add(key, count, COUNT_TIMEOUT)
+    return count
+
+
+def change_counts(scopes, delta):
+    """Сдвигает счетчики разделов; отсутствующие посчитаются заново."""
+    if not counters_enabled():
+        return
+    for scope in scopes:
+        try:
+            cache.incr(count_key(scope), delta)
+        except ValueError:
+            pass
+
+
+def reset_counts(scopes):
+    cache.delete_many([count_key(scope) for scope in scopes])
+
+
+def encode_cursor(obj, date_field='pub_date', key_field='pk'):
+    """Упаковывает пару (дата, id) записи в непрозрачный токен."""
+    value = (
+        f'{getattr(obj, date_field).isoformat()}|{getattr(obj, key_field)}')
+    return base64.urlsafe_b64encode(value.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """Распаковывает токен курсора, для битого токена возвращает None."""
+    try:
+        padding = '=' * (-len(token) % 4)
+        value = base64.urlsafe_b64decode(token + padding).decode()
+        date, pk = value.split('|')
+        date = parse_datetime(date)
+        pk = int(pk)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        return None
+    if date is None:
+        return None
+    return date, pk
+
+
+class CursorPaginator(Paginator):
+    """Keyset-паджинация по паре (дата, id) без COUNT(*) и OFFSET.
 
+    Страница выбирается условием на ключ предыдущей/следующей записи,
+    поэтому глубокие страницы стоят столько же, сколько первая. Вторым
+    полем ключа может быть не pk, например post_id у записей ленты.
+    """
 
-def get_page(request, post_list):
-    """ Паджинация 10 постов на страницу."""
-    paginator = Paginator(post_list, POST_NUMBER)
+    is_cursor = True
+
+    def __init__(self, object_list, per_page, date_field='pub_date',
+                 key_field='pk'):
+        super().__init__(object_list, per_page)
+        self.date_field = date_field
+        self.key_field = key_field
+        self.next_cursor = None
+        self.previous_cursor = None
+
+    def _after(self, date, pk):
+        return (
+            Q(**{f'{self.date_field}__lt': date})
+            | Q(**{self.date_field: date, f'{self.key_field}__lt': pk})
+        )
+
+    def _before(self, date, pk):
+        return (
+            Q(**{f'{self.date_field}__gt': date})
+            | Q(**{self.date_field: date, f'{self.key_field}__gt': pk})
+        )
+
+    def get_cursor_page(self, after=None, before=None):
+        """Возвращает страницу после курсора `after` или до `before`."""
+        after = decode_cursor(after) if after else None
+        before = decode_cursor(before) if before else None
+        field, key = self.date_field, self.key_field
+        queryset = self.object_list
+        if before is not None:
+            queryset = queryset.filter(self._before(*before)).order_by(
+                field, key)
+        else:
+            if after is not None:
+                queryset = queryset.filter(self._after(*after))
+            queryset = queryset.order_by(f'-{field}', f'-{key}')
+
+        items = list(queryset[:self.per_page + 1])
+        if before is not None and not items:
+            return self.get_cursor_page()
+        has_more = len(items) > self.per_page
+        items = items[:self.per_page]
+        if before is not None:
+            items.reverse()
+            has_newer, has_older = has_more, True
+        else:
+            has_newer, has_older = after is not None, has_more
+
+        if items and has_older:
+            self.next_cursor = encode_cursor(items[-1], field, key)
+        if items and has_newer:
+            self.previous_cursor = encode_cursor(items[0], field, key)
+        return Page(items, 1, self)
+
+    @property
+    def has_other_pages(self):
+        return bool(self.next_cursor or self.previous_cursor)
+
+
+class CountedPaginator(Paginator):
+    """Паджинатор по номерам, берущий общее число записей из кеша."""
+
+    ELLIPSIS = '…'
+
+    def __init__(self, object_list, per_page, scope=None):
+        super().__init__(object_list, per_page)
+        self.scope = scope
+
+    @cached_property
+    def count(self):
+        if self.scope is None:
+            return super().count
+        return get_count(self.scope, self.object_list)
+
+    def get_elided_page_range(self, number,
+                              on_each_side=PAGE_LINKS_ON_EACH_SIDE):
+        """Номера страниц вокруг текущей плюс первая и последняя."""
+        first = max(number - on_each_side, 1)
+        last = min(number + on_each_side, self.num_pages)
+        if first > 1:
+            yield 1
+            if first > 2:
+                yield self.ELLIPSIS
+        yield from range(first, last + 1)
+        if last < self.num_pages:
+            if last < self.num_pages - 1:
+                yield self.ELLIPSIS
+            yield self.num_pages
+
+
+def get_page(request, post_list, scope=None, key_field='pk'):
+    """ Паджинация 10 постов на страницу.
+
+    По умолчанию используется курсор `?after=`/`?before=`; номер страницы
+    `?page=` оставлен как запасной вариант. Для него общее число записей
+    берется из кешированного счетчика раздела `scope`.
+    """
     page_number = request.GET.get('page')
+    if page_number is not None:
+        paginator = CountedPaginator(post_list, POST_NUMBER, scope)
+        page = paginator.get_page(page_number)
+        page.elided_page_range = list(
+            paginator.get_elided_page_range(page.number))
+        return page
+
+    paginator = CursorPaginator(post_list, POST_NUMBER, key_field=key_field)
+    return paginator.get_cursor_page(
+        after=request.GET.get('after'),
+        before=request.GET.get('before'),
+    )
+
 
-    return paginator.get_page(page_number)
+def get_comment_page(comments, after=None):
+    """Порция из COMMENT_NUMBER комментариев после курсора, новые первыми."""
+    paginator = CursorPaginator(comments, COMMENT_NUMBER, 'created')
+    return paginator.get_cursor_page(after=after)
@@ -1,11 +1,22 @@
 from django.contrib.auth.decorators import login_required
+from django.db.models import Exists, OuterRef
 from django.shortcuts import get_object_or_404, redirect, render
 
+from .api import api_response, comment_data
+from .conditional import (anonymous_conditional, comments_scopes, conditional,
+                          group_scopes, index_scopes, post_scopes,
+                          profile_scopes)
+from .feeds import attach_posts, feed_entries
 from .forms import CommentForm, PostForm
+from .fragments import fragment_version
 from .models import Follow, Group, Post, User
-from .utils import get_page
+from .pages import cached_page
+from .search import search_posts
+from .utils import POST_NUMBER, get_comment_page, get_page
 
 
+@anonymous_conditional(index_scopes)
+@cached_page(index_scopes)
 def index(request):
     """Функция index передает данные в шаблон index.html."""
     template = 'posts/index.html'
@@ -13,15 +24,18 @@ def index(request):
         'author',
         'group'
     )
-    page_obj = get_page(request, post_list)
+    page_obj = get_page(request, post_list, 'index')
     # Здесь код запроса к модели и создание словаря контекста
     context = {
         'page_obj': page_obj,
+        'cache_version': fragment_version('index', 'groups'),
     }
 
     return render(request, template, context)
 
 
+@anonymous_conditional(group_scopes)
+@cached_page(group_scopes)
 def group_posts(request, slug):
     """Функция group_posts передает данные в шаблон group_list.html."""
     template = 'posts/group_list.html'
@@ -29,66 +43,113 @@ def group_posts(request, slug):
     post_list = group.posts.select_related(
         'author'
     )
-    page_obj = get_page(request, post_list)
+    page_obj = get_page(request, post_list, f'group:{group.pk}')
     # Здесь код запроса к модели и создание словаря контекста
     context = {
         'group': group,
-        'page_obj': page_obj
+        'page_obj': page_obj,
+        'cache_version': fragment_version(f'group:{group.pk}'),
     }
 
     return render(request, template, context)
 
 
+@anonymous_conditional(profile_scopes)
 def profile(request, username):
     """Здесь код запроса к модели и создание словаря контекста."""
     template = 'posts/profile.html'
-    # В тело страницы выведен список постов
-    author = get_object_or_404(
-        User.objects.all().prefetch_related(
-            'posts',
-            'posts__group'
-        ), username=username)
-    posts_list = author.posts.all()
-    page_obj = get_page(request, posts_list)
-    following = False
-    # Здесь код запроса к модели и создание словаря контекста
+    # Посты автора выбираются только для текущей страницы
+    authors = User.objects.select_related('stats')
+    # Подписка проверяется подзапросом в том же запросе, что и автор
     if request.user.is_authenticated:
-        following = Follow.objects.filter(
-            user=request.user, author=author
-        ).exists()
+        authors = authors.annotate(is_followed=Exists(Follow.objects.filter(
+            user=request.user, author=OuterRef('pk'))))
+    author = get_object_or_404(authors, username=username)
+    posts_list = author.posts.select_related('group')
+    page_obj = get_page(request, posts_list, f'author:{author.pk}')
+    following = getattr(author, 'is_followed', False)
     context = {
         'author': author,
         'page_obj': page_obj,
         'following': following,
+        'cache_version': fragment_version(f'author:{author.pk}', 'groups'),
     }
 
     return render(request, template, context)
 
 
+@anonymous_conditional(post_scopes)
 def post_detail(request, post_id):
     template = 'posts/post_detail.html'
     """Здесь код запроса к модели и создание словаря контекста."""
-    post = get_object_or_404(Post, pk=post_id)
-    comments = post.comments.all()
+    post = get_object_or_404(
+        Post.objects.select_related('author__stats', 'group'),
+        pk=post_id)
+    # Остальные комментарии подгружаются порциями через post_comments
+    comments = get_comment_page(
+        post.comments.select_related('author'),
+        after=request.GET.get('comments_after'))
     form = CommentForm(request.POST or None)
     # В тело страницы выведен один пост, выбранный по pk
     context = {
         'post': post,
         'form': form,
         'comments': comments,
+        'comments_count': post.comments_count,
+        'cache_version': fragment_version(f'post:{post.pk}'),
     }
 
     return render(request, template, context)
 
 
+@conditional(comments_scopes)
+def post_comments(request, post_id):
+    """Следующая порция комментариев поста: HTML-фрагмент или JSON."""
+    post = get_object_or_404(Post.objects.only('pk'), pk=post_id)
+    comments = get_comment_page(
+        post.comments.select_related('author'),
+        after=request.GET.get('after'))
+    if request.GET.get('format') == 'json':
+        return api_response({
+            'comments': [comment_data(comment) for comment in comments],
+            'next': comments.paginator.next_cursor,
+        })
+    context = {
+        'post': post,
+        'comments': comments,
+    }
+
+    return render(request, 'posts/includes/comment_list.html', context)
+
+
+def search(request):
+    """Поиск по текстам постов и комментариев с учетом морфологии."""
+    query = request.GET.get('q', '').strip()
+    try:
+        page_number = max(int(request.GET.get('page', 1)), 1)
+    except ValueError:
+        page_number = 1
+    posts = []
+    if query:
+        posts = search_posts(
+            query, POST_NUMBER + 1, (page_number - 1) * POST_NUMBER)
+    context = {
+        'query': query,
+        'posts': posts[:POST_NUMBER],
+        'page_number': page_number,
+        'has_next': len(posts) > POST_NUMBER,
+    }
+
+    return render(request, 'posts/search.html', context)
+
+
 @login_required
 def post_create(request):
     """Добавлена "Новая запись" для авторизованных пользователей."""
     form = PostForm(request.POST or None, files=request.FILES or None)
     if form.is_valid():
-        new_post = form.save(commit=False)
-        new_post.author = request.user
-        new_post.save()
+        form.instance.author = request.user
+        form.save()
         return redirect('posts:profile', username=request.user)
     context = {
         'form': form,
@@ -146,8 +207,10 @@ def add_comment(request, post_id):
 
 @login_required
 def follow_index(request):
-    list_of_posts = Post.objects.filter(author__following__user=request.user)
-    page_obj = get_page(request, list_of_posts)
+    # Страница выбирается по индексу ленты, посты догружаются по id
+    page_obj = attach_posts(get_page(
+        request, feed_entries(request.user), f'follower:{request.user.pk}',
+        key_field='post_id'))
     context = {'page_obj': page_obj}
 
     return render(request, 'posts/follow.html', context)
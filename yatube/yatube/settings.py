@@ -31,14 +31,45 @@ INSTALLED_APPS = [
 ]
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
-CACHES = {
-    'default': {
+# Загрузки больше мегабайта пишутся во временный файл, а не в память.
+FILE_UPLOAD_MAX_MEMORY_SIZE = 1024 * 1024
+# Кеш по умолчанию локальный для процесса. Под несколькими воркерами
+# gunicorn нужен общий: YATUBE_CACHE=file, db (после createcachetable)
+# или memcached с адресом в YATUBE_CACHE_LOCATION. Версии фрагментов,
+# ETag страниц и API в локальном кеше у каждого воркера свои, поэтому
+# там фрагменты и версии живут всего 20 секунд (posts.fragments).
+# Счетчики постов держат только locmem и memcached с атомарным incr,
+# с file и db число страниц каждый раз считает COUNT(*). Блокировки
+# пересборки фрагментов у file - отдельные файлы с O_EXCL рядом с кешем.
+# Суммы /metrics/ по всем воркерам собирает только memcached, с другими
+# кешами каждый воркер отдает свои (core.metrics).
+CACHE_BACKENDS = {
+    'locmem': {
         'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-    }
+    },
+    'file': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get(
+            'YATUBE_CACHE_LOCATION', os.path.join(BASE_DIR, 'cache')),
+    },
+    'db': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': os.environ.get('YATUBE_CACHE_LOCATION', 'yatube_cache'),
+    },
+    'memcached': {
+        'BACKEND': 'django.core.cache.backends.memcached.MemcachedCache',
+        'LOCATION': os.environ.get(
+            'YATUBE_CACHE_LOCATION', '127.0.0.1:11211'),
+    },
+}
+CACHES = {
+    'default': CACHE_BACKENDS[os.environ.get('YATUBE_CACHE', 'locmem')],
 }
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'core.middleware.RequestMetricsMiddleware',
+    'django.middleware.http.ConditionalGetMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -47,13 +78,23 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Доля запросов, у которых замеряются SQL, шаблоны и кеш (см. /metrics/)
+METRICS_SAMPLE_RATE = float(os.environ.get('YATUBE_METRICS_SAMPLE_RATE', 0.01))
+# Сколько секунд обратный прокси может отдавать анонимную страницу
+# без перепроверки ETag
+PAGE_CACHE_SECONDS = int(os.environ.get('YATUBE_PAGE_CACHE_SECONDS', 10))
+# Токен для сборщика метрик: Authorization: Bearer <токен>. Без него
+# /metrics/ открыт только персоналу.
+METRICS_TOKEN = os.environ.get('YATUBE_METRICS_TOKEN', '')
+
 ROOT_URLCONF = 'yatube.urls'
 STATICFILES_DIRS = (os.path.join(BASE_DIR, 'static'),)
 
 TEMPLATES_DIR = os.path.join(BASE_DIR, 'templates')
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates, который считает время отрисовки для метрик
+        'BACKEND': 'core.metrics.TimedDjangoTemplates',
         'DIRS': [TEMPLATES_DIR],
         'APP_DIRS': True,
         'OPTIONS': {